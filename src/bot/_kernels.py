@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import numpy as np
+
+# Numba is optional (pip install .[jit]); without it the kernels below run as
+# plain Python over the same arrays.
+try:
+    from numba import njit  # type: ignore
+
+    HAVE_NUMBA = True
+except Exception:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):  # type: ignore[no-redef]
+        def wrap(fn):
+            return fn
+
+        return wrap
+
+
+# fastmath without nnan/ninf: "not enough data" is reported as NaN and must survive compilation
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Kernels return only the final value of each indicator; the recurrence state
+# lives in locals, no per-bar output array is allocated.
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def ema_last_f64(x, period):
+    n = x.shape[0]
+    if n == 0:
+        return np.nan
+    if period <= 1:
+        return x[n - 1]
+    if n < period:
+        return np.nan
+    k = 2.0 / (period + 1)
+    s = 0.0
+    for i in range(period):
+        s += x[i]
+    prev = s / period
+    for i in range(period, n):
+        prev = x[i] * k + prev * (1.0 - k)
+    return prev
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def rsi_last_f64(x, period):
+    n = x.shape[0]
+    if n < period + 1:
+        return np.nan
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, period + 1):
+        change = x[i] - x[i - 1]
+        if change > 0:
+            avg_gain += change
+        else:
+            avg_loss -= change
+    avg_gain /= period
+    avg_loss /= period
+    for i in range(period + 1, n):
+        change = x[i] - x[i - 1]
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+    return 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def atr_last_f64(h, l, c, period):
+    # True range and its EMA fused into one pass: no intermediate TR array
+    n = h.shape[0]
+    if n == 0:
+        return np.nan
+    if period <= 1:
+        tr = h[n - 1] - l[n - 1]
+        if n > 1:
+            tr = max(tr, abs(h[n - 1] - c[n - 2]), abs(l[n - 1] - c[n - 2]))
+        return tr
+    if n < period:
+        return np.nan
+    k = 2.0 / (period + 1)
+    s = h[0] - l[0]
+    for i in range(1, period):
+        s += max(h[i] - l[i], abs(h[i] - c[i - 1]), abs(l[i] - c[i - 1]))
+    prev = s / period
+    for i in range(period, n):
+        tr = max(h[i] - l[i], abs(h[i] - c[i - 1]), abs(l[i] - c[i - 1]))
+        prev = tr * k + prev * (1.0 - k)
+    return prev
+
+
+def _warm_up() -> None:
+    # Trigger compilation (or load from the on-disk cache) at import time so the
+    # first trading cycle does not pay JIT latency.
+    x = np.zeros(2, dtype=np.float64)
+    ema_last_f64(x, 1)
+    rsi_last_f64(x, 1)
+    atr_last_f64(x, x, x, 1)
+
+
+if HAVE_NUMBA:
+    _warm_up()
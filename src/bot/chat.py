@@ -1,91 +1,212 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import logging
+import time
+from collections import OrderedDict
 from typing import Any, Dict, Optional
 
+import orjson
+from pydantic_core import from_json
 from tenacity import retry, wait_exponential, stop_after_attempt
 from openai import OpenAI, BadRequestError, NotFoundError
 
-from .decisions import validate_decision, Decision
+from .decisions import validate_decision, validate_decision_json, Decision, DoNothingDecision
+from .metrics import llm_cache_hits_total, llm_cache_misses_total
+
+
+logger = logging.getLogger(__name__)
+
+_RESPONSE_FORMAT = {"type": "json_object"}
+_FALLBACK_MODEL = "gpt-4o-mini"
+_HINT_PREFIX = '{"_hint":"верни валидный JSON без пояснений"'
+_FALLBACK_KEY = "fallback-do-nothing"
+# Heavy lists that may be tail-truncated (oldest rows dropped) when the payload is over budget,
+# in the order they are pruned
+_PRUNABLE_PATHS = (
+    ("extra_data", "ohlcv"),
+    ("extra_data", "trades"),
+    ("recent_ohlcv",),
+    ("extra_data", "orderbook", "bids"),
+    ("extra_data", "orderbook", "asks"),
+    ("extra_data", "open_orders"),
+)
+_PRUNE_MIN_ROWS = 20
+# The fallback decision is built with model_construct (no validation); check once at
+# import that it is still a valid decision under the current schema.
+validate_decision({"action": "do_nothing", "idempotency_key": _FALLBACK_KEY, "params": {}}, remaining_info_requests=1)
+
+
+def _dumps(payload: Dict[str, Any]) -> bytes:
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _prune_payload(payload: Dict[str, Any], max_bytes: int = 32_768) -> Dict[str, Any]:
+    """Tail-truncate heavy lists until the serialized payload fits into max_bytes.
+
+    The caller's dict is not modified: containers on a pruned path are copied.
+    Lists are never cut below _PRUNE_MIN_ROWS rows, so the result may still be
+    over budget. max_bytes <= 0 disables pruning.
+    """
+    if max_bytes <= 0:
+        return payload
+    size = len(_dumps(payload))
+    if size <= max_bytes:
+        return payload
+    original = size
+    dropped: Dict[str, int] = {}
+    out = dict(payload)
+    for path in _PRUNABLE_PATHS:
+        parent: Any = out
+        for key in path[:-1]:
+            child = parent.get(key) if isinstance(parent, dict) else None
+            if not isinstance(child, dict):
+                parent = None
+                break
+            parent[key] = child = dict(child)
+            parent = child
+        rows = parent.get(path[-1]) if parent is not None else None
+        if not isinstance(rows, list):
+            continue
+        while size > max_bytes and len(rows) > _PRUNE_MIN_ROWS:
+            # drop roughly as many rows as the excess needs, assuming rows of average size
+            row_bytes = max(len(_dumps(rows)) // len(rows), 1)
+            drop = min(-(-(size - max_bytes) // row_bytes), len(rows) - _PRUNE_MIN_ROWS)
+            rows = rows[drop:]
+            parent[path[-1]] = rows
+            dropped[".".join(path)] = dropped.get(".".join(path), 0) + drop
+            size = len(_dumps(out))
+        if size <= max_bytes:
+            break
+    logger.info("Payload pruned %d -> %d bytes (budget %d), rows dropped: %s", original, size, max_bytes, dropped)
+    return out
 
 
 class ChatClient:
-    def __init__(self, api_key: Optional[str], model: str, temperature: float, system_prompt_path: str):
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str,
+        temperature: float,
+        system_prompt_path: str,
+        cache_size: int = 512,
+        cache_ttl_sec: float = 300.0,
+        max_payload_bytes: int = 32_768,
+    ):
         self.client = OpenAI(api_key=api_key)
         self.model = model
         self.temperature = temperature
+        # The prompt is read once: edits on disk take effect only with a new ChatClient.
         with open(system_prompt_path, "r", encoding="utf-8") as f:
             self.system_prompt = f.read()
+        # Same dict object on every request keeps the prefix byte-identical for prompt caching
+        self._system_msg = {"role": "system", "content": self.system_prompt}
+        self._prompt_sha = hashlib.blake2b(self.system_prompt.encode("utf-8"), digest_size=8).hexdigest()
+        logger.info("System prompt loaded from %s fingerprint=%s", system_prompt_path, self._prompt_sha)
+        # Request shape is fixed per model: gpt-5-* takes no temperature and is not streamed
+        is_gpt5 = str(model).startswith("gpt-5-")
+        self._use_temperature = not is_gpt5
+        self._stream = not is_gpt5
+        # Replies are only reproducible with temperature 0, which gpt-5-* ignores
+        self._cache_enabled = cache_size > 0 and temperature == 0 and self._use_temperature
+        self._max_payload_bytes = max_payload_bytes
+        self._cache_size = cache_size
+        self._cache_ttl_sec = cache_ttl_sec
+        # key -> (monotonic time stored, raw reply)
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def _cache_key(self, user_payload_json: str) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.model}|{self._prompt_sha}|".encode("utf-8"))
+        h.update(user_payload_json.encode("utf-8"))
+        return h.hexdigest()
+
+    def _ask(self, user_payload_json: str) -> tuple[str, Optional[str]]:
+        """Reply for the payload, plus the cache key to store it under once it validates (None on a hit)."""
+        if not self._cache_enabled:
+            return self._request(user_payload_json), None
+        key = self._cache_key(user_payload_json)
+        hit = self._cache.get(key)
+        if hit is not None and time.monotonic() - hit[0] <= self._cache_ttl_sec:
+            self._cache.move_to_end(key)
+            llm_cache_hits_total.inc()
+            return hit[1], None
+        llm_cache_misses_total.inc()
+        return self._request(user_payload_json), key
+
+    def _validated(self, reply: str, cache_key: Optional[str], remaining_info_requests: int) -> Decision:
+        decision = validate_decision_json(reply, remaining_info_requests)
+        # only replies that validate are cached: a bad one must not be replayed for the whole TTL
+        if cache_key is not None:
+            self._cache[cache_key] = (time.monotonic(), reply)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return decision
 
     @retry(wait=wait_exponential(multiplier=1, min=1, max=8), stop=stop_after_attempt(3))
-    def _ask(self, user_payload_json: str) -> str:
+    def _request(self, user_payload_json: str) -> str:
         messages = [
-            {"role": "system", "content": self.system_prompt},
+            self._system_msg,
             {"role": "user", "content": user_payload_json},
         ]
         # First attempt: as configured
+        kwargs: Dict[str, Any] = {"model": self.model, "messages": messages, "response_format": _RESPONSE_FORMAT}
+        if self._use_temperature:
+            kwargs["temperature"] = self.temperature
         try:
-            if str(self.model).startswith("gpt-5-"):
-                resp = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                )
-            else:
-                resp = self.client.chat.completions.create(
-                    model=self.model,
-                    temperature=self.temperature,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                )
-            return resp.choices[0].message.content or ""
+            return self._complete(self._stream, **kwargs)
         except BadRequestError as e:
             msg = str(e)
             # Retry without temperature if model forbids it
             if "temperature" in msg.lower():
-                resp = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                )
-                return resp.choices[0].message.content or ""
+                kwargs.pop("temperature", None)
+                return self._complete(self._stream, **kwargs)
             # Fallback to default model if bad request indicates model issues
             if "model" in msg.lower() or "not found" in msg.lower():
-                fallback_model = "gpt-4o-mini"
-                resp = self.client.chat.completions.create(
-                    model=fallback_model,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                )
-                return resp.choices[0].message.content or ""
+                return self._complete(True, model=_FALLBACK_MODEL, messages=messages, response_format=_RESPONSE_FORMAT)
             raise
         except NotFoundError:
             # Model not found -> fallback
-            fallback_model = "gpt-4o-mini"
-            resp = self.client.chat.completions.create(
-                model=fallback_model,
-                messages=messages,
-                response_format={"type": "json_object"},
-            )
+            return self._complete(True, model=_FALLBACK_MODEL, messages=messages, response_format=_RESPONSE_FORMAT)
+
+    def _complete(self, stream: bool, **kwargs: Any) -> str:
+        if not stream:
+            resp = self.client.chat.completions.create(**kwargs)
             return resp.choices[0].message.content or ""
+        # Stream the reply and stop reading once it forms a complete JSON object,
+        # so validation overlaps with the tail of the response instead of waiting for it.
+        buf = bytearray()
+        resp = self.client.chat.completions.create(stream=True, **kwargs)
+        try:
+            for chunk in resp:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                buf += delta.encode("utf-8")
+                if buf.rstrip().endswith(b"}"):
+                    try:
+                        from_json(buf)
+                    except ValueError:
+                        continue
+                    break
+        finally:
+            resp.close()
+        return buf.decode("utf-8")
 
     def decide(self, payload: Dict[str, Any], remaining_info_requests: int) -> Decision:
-        user_json = json.dumps(payload, ensure_ascii=False)
-        first = self._ask(user_json)
+        user_json = _dumps(_prune_payload(payload, self._max_payload_bytes)).decode("utf-8")
+        first, key = self._ask(user_json)
         try:
-            obj = json.loads(first)
-            return validate_decision(obj, remaining_info_requests)
+            return self._validated(first, key, remaining_info_requests)
         except Exception:
-            # one retry with strict hint
-            hint_payload = {
-                "_hint": "верни валидный JSON без пояснений",
-                **payload,
-            }
-            user_json2 = json.dumps(hint_payload, ensure_ascii=False)
-            second = self._ask(user_json2)
+            # one retry with strict hint, spliced in front of the already-serialized payload
+            user_json2 = _HINT_PREFIX + ("}" if user_json == "{}" else "," + user_json[1:])
+            second, key = self._ask(user_json2)
             try:
-                obj2 = json.loads(second)
-                return validate_decision(obj2, remaining_info_requests)
+                return self._validated(second, key, remaining_info_requests)
             except Exception:
                 # fallback to do_nothing
-                return Decision(action="do_nothing", idempotency_key="fallback-do-nothing", params={})
+                return DoNothingDecision.model_construct(action="do_nothing", idempotency_key=_FALLBACK_KEY, params={})
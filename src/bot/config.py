@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import copy
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -8,6 +11,17 @@ import yaml
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, ValidationError
 
+# env value classifiers: decide the cast up front instead of try/except around int()/float().
+# They accept what int()/float() accept (surrounding whitespace, digit-group underscores);
+# only values containing "." are floats, so "1e5" stays a string.
+_DIGITS = r"\d+(?:_\d+)*"
+_BOOL_RE = re.compile(r"^(?:true|false)$", re.IGNORECASE)
+_INT_RE = re.compile(rf"^\s*[-+]?{_DIGITS}\s*$")
+_FLOAT_RE = re.compile(rf"^\s*[-+]?(?:{_DIGITS}\.(?:{_DIGITS})?|\.{_DIGITS})(?:[eE][-+]?{_DIGITS})?\s*$")
+
+# libyaml-backed loader when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 class ExchangeConfig(BaseModel):
     symbol: str = Field("ETH/USDT:USDT")
@@ -16,6 +30,8 @@ class ExchangeConfig(BaseModel):
     margin_mode: str = Field("cross")
     post_only: bool = Field(False)
     testnet: bool = Field(False)
+    websocket: bool = Field(True)
+    websocket_stale_sec: float = Field(10.0, gt=0.0)
 
 
 class LimitsConfig(BaseModel):
@@ -35,6 +51,9 @@ class ChatConfig(BaseModel):
     model: str = Field("gpt-4o-mini")
     temperature: float = Field(0)
     system_prompt_path: str = Field("prompts/system.md")
+    response_cache_size: int = Field(512, ge=0)
+    response_cache_ttl_sec: float = Field(300.0, ge=0.0)
+    max_payload_bytes: int = Field(32768, ge=0)
 
 
 class LogsConfig(BaseModel):
@@ -49,6 +68,8 @@ class MetricsConfig(BaseModel):
 class RuntimeConfig(BaseModel):
     dry_run: bool = Field(False)
     state_db_path: str = Field("state.db")
+    state_in_memory: bool = Field(False)
+    state_snapshot_interval_sec: float = Field(30.0, gt=0.0)
 
 
 class AppConfig(BaseModel):
@@ -62,11 +83,15 @@ class AppConfig(BaseModel):
 
 
 def deep_update(d: dict, u: dict) -> dict:
-    for k, v in u.items():
-        if isinstance(v, dict) and isinstance(d.get(k), dict):
-            d[k] = deep_update(d.get(k, {}), v)
-        else:
-            d[k] = v
+    stack = [(d, u)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            cur = dst.get(k)
+            if isinstance(v, dict) and isinstance(cur, dict):
+                stack.append((cur, v))
+            else:
+                dst[k] = v
     return d
 
 
@@ -74,37 +99,53 @@ def env_overlay(prefix: str = "BGB__") -> dict:
     """Overlay settings from environment variables with a prefix.
     Example: BGB__EXCHANGE__SYMBOL=BTC/USDT:USDT -> {"exchange": {"symbol": "BTC/USDT:USDT"}}
     Booleans: true/false/1/0; integers and floats auto-cast when possible.
+    The parsed overlay is cached per set of matching variables; see env_overlay.cache_clear.
     """
+    items = tuple(sorted((k, v) for k, v in os.environ.items() if k.startswith(prefix)))
+    # callers merge into (and may mutate) the result, so hand out a copy of the cached tree
+    return copy.deepcopy(_parse_env_overlay(prefix, items))
+
+
+@lru_cache(maxsize=1)
+def _parse_env_overlay(prefix: str, items: tuple[tuple[str, str], ...]) -> dict:
     out: dict = {}
-    for key, value in os.environ.items():
-        if not key.startswith(prefix):
-            continue
+    for key, value in items:
         path = key[len(prefix):].lower().split("__")
         ref = out
         for p in path[:-1]:
             ref = ref.setdefault(p, {})
-        # cast
-        v: object = value
-        if value.lower() in {"true", "false"}:
-            v = value.lower() == "true"
-        else:
-            try:
-                if "." in value:
-                    v = float(value)
-                else:
-                    v = int(value)
-            except ValueError:
-                v = value
-        ref[path[-1]] = v
+        ref[path[-1]] = _cast_env_value(value)
     return out
 
 
+def _cast_env_value(value: str) -> object:
+    if _BOOL_RE.match(value):
+        return value.lower() == "true"
+    if _INT_RE.match(value):
+        return int(value)
+    if _FLOAT_RE.match(value):
+        return float(value)
+    return value
+
+
+env_overlay.cache_clear = _parse_env_overlay.cache_clear  # type: ignore[attr-defined]
+
+
+@lru_cache(maxsize=None)
+def load_env(env_file: Optional[str] = None) -> None:
+    """Load a .env file into os.environ (existing variables win), once per path."""
+    if env_file:
+        load_dotenv(dotenv_path=env_file, override=False)
+    else:
+        load_dotenv(override=False)
+
+
 def load_config(path: str | Path | None) -> AppConfig:
-    load_dotenv(override=False)
+    load_env()
     base: dict = {}
     if path:
         with open(path, "r", encoding="utf-8") as f:
-            base = yaml.safe_load(f) or {}
+            base = yaml.load(f, Loader=_YamlLoader) or {}
 
     # overlay from env prefix
     overlay = env_overlay()
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from typing import Literal, Optional, List, Dict, Any
-from pydantic import BaseModel, Field, field_validator, ValidationError
+from typing import Annotated, Literal, Optional, List, Dict, Any, Union
+from pydantic import BaseModel, Field, TypeAdapter, field_validator, ValidationError
 
 
 ActionLiteral = Literal[
@@ -97,53 +97,80 @@ class RequestDataParams(BaseModel):
     requests: List[RequestItem]
 
 
-class DecisionBase(BaseModel):
-    action: ActionLiteral
-    idempotency_key: str
-    params: dict
-
-
 class Decision(BaseModel):
     action: ActionLiteral
     idempotency_key: str
     params: PlaceOrderParams | CancelOrderParams | ClosePositionParams | RequestDataParams | dict
 
 
+# Per-action decisions: `action` is the tag of a discriminated union, so the
+# params model is picked in one lookup instead of trying each union member.
+
+
+class PlaceOrderDecision(Decision):
+    action: Literal["place_order"]
+    params: PlaceOrderParams
+
+
+class CancelOrderDecision(Decision):
+    action: Literal["cancel_order"]
+    params: CancelOrderParams
+
+
+class ClosePositionDecision(Decision):
+    action: Literal["close_position"]
+    params: ClosePositionParams
+
+
+class RequestDataDecision(Decision):
+    action: Literal["request_data"]
+    params: RequestDataParams
+
+
+class DoNothingDecision(Decision):
+    action: Literal["do_nothing"]
+    params: dict
+
+    @field_validator("params")
+    @classmethod
+    def drop_params(cls, v):
+        return {}
+
+
+_DECISION_ADAPTER: TypeAdapter[Decision] = TypeAdapter(
+    Annotated[
+        Union[
+            PlaceOrderDecision,
+            CancelOrderDecision,
+            ClosePositionDecision,
+            RequestDataDecision,
+            DoNothingDecision,
+        ],
+        Field(discriminator="action"),
+    ]
+)
+
+
 def validate_decision(decision_dict: dict, remaining_info_requests: int) -> Decision:
-    try:
-        base = DecisionBase.model_validate(decision_dict)
-    except ValidationError as e:
-        raise
-
-    action = base.action
-    parsed: Decision
-    if action == "place_order":
-        parsed = Decision(action=action, idempotency_key=base.idempotency_key, params=PlaceOrderParams.model_validate(base.params))
-    elif action == "cancel_order":
-        parsed = Decision(action=action, idempotency_key=base.idempotency_key, params=CancelOrderParams.model_validate(base.params))
-    elif action == "close_position":
-        parsed = Decision(action=action, idempotency_key=base.idempotency_key, params=ClosePositionParams.model_validate(base.params))
-    elif action == "request_data":
-        if remaining_info_requests <= 1:
-            # Force a pydantic ValidationError by validating an invalid action
-            Decision.model_validate({
-                "action": "request_data_forbidden",
-                "idempotency_key": base.idempotency_key,
-                "params": base.params,
-            })
-        parsed = Decision(action=action, idempotency_key=base.idempotency_key, params=RequestDataParams.model_validate(base.params))
-    elif action == "do_nothing":
-        parsed = Decision(action=action, idempotency_key=base.idempotency_key, params={})
-    else:
+    return _check_info_budget(_DECISION_ADAPTER.validate_python(decision_dict), remaining_info_requests)
+
+
+def validate_decision_json(raw: str | bytes, remaining_info_requests: int) -> Decision:
+    # Parse the raw model reply straight into the tagged union (single pass, no json.loads)
+    return _check_info_budget(_DECISION_ADAPTER.validate_json(raw), remaining_info_requests)
+
+
+def _check_info_budget(decision: Decision, remaining_info_requests: int) -> Decision:
+    if decision.action == "request_data" and remaining_info_requests <= 1:
         raise ValidationError.from_exception_data(
             Decision.__name__,
             [
                 {
                     "type": "value_error",
                     "loc": ("action",),
-                    "msg": f"Unsupported action {action}",
-                    "input": decision_dict,
+                    "input": decision.action,
+                    "ctx": {"error": ValueError("request_data is not allowed on the last attempt")},
                 }
             ],
         )
-    return parsed
+    return decision
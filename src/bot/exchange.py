@@ -1,24 +1,321 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import threading
 import ccxt
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
 import time
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, Coroutine, Deque, Dict, List, Optional, Tuple, TypeVar
 
-from .formatting import build_market_info, normalize_price, normalize_amount
+from .formatting import MarketInfo, build_market_info, normalize_price, normalize_amount
+from .scheduler import timeframe_seconds
 
 
-class BybitExchange:
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Bybit swap order book subscriptions only accept these depths; the top levels are sliced locally
+_WS_ORDERBOOK_DEPTH = 50
+
+
+def _client_options(api_key: Optional[str], api_secret: Optional[str]) -> Dict[str, Any]:
+    return {
+        "apiKey": api_key or "",
+        "secret": api_secret or "",
+        "enableRateLimit": True,
+        "options": {"defaultType": "swap"},
+    }
+
+
+class AsyncBybitExchange:
+    """ccxt.async_support twin of BybitExchange's snapshot fetchers.
+
+    Lets independent REST calls run concurrently: fetch_snapshots() fires a
+    batch of requests with asyncio.gather, so a batch costs about one
+    round-trip instead of the sum of them.
+    """
+
     def __init__(self, api_key: Optional[str], api_secret: Optional[str], testnet: bool):
-        opts = {
-            "apiKey": api_key or "",
-            "secret": api_secret or "",
-            "enableRateLimit": True,
-            "options": {"defaultType": "swap"},
+        self.client = ccxt_async.bybit(_client_options(api_key, api_secret))
+        self.client.set_sandbox_mode(bool(testnet))
+
+    async def init(self):
+        await self.client.load_markets()
+
+    async def close(self):
+        await self.client.close()
+
+    async def fetch_ohlcv(self, symbol: str, timeframe: str, limit: int = 200):
+        return await self.client.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+
+    async def fetch_balance(self):
+        return await self.client.fetch_balance()
+
+    async def fetch_positions(self, symbols: Optional[List[str]] = None):
+        return await self.client.fetch_positions(symbols)
+
+    async def fetch_open_orders(self, symbol: str):
+        return await self.client.fetch_open_orders(symbol)
+
+    async def fetch_ticker(self, symbol: str):
+        return await self.client.fetch_ticker(symbol)
+
+    async def fetch_order_book(self, symbol: str, limit: int = 5):
+        return await self.client.fetch_order_book(symbol, limit=limit)
+
+    async def fetch_trades(self, symbol: str, limit: int = 200):
+        try:
+            return await self.client.fetch_trades(symbol, limit=limit)
+        except Exception:
+            return []
+
+    async def fetch_funding_rate(self, symbol: str):
+        try:
+            if hasattr(self.client, 'fetch_funding_rate'):
+                return await self.client.fetch_funding_rate(symbol)
+        except Exception:
+            return None
+        return None
+
+    async def fetch_open_interest(self, symbol: str):
+        try:
+            if hasattr(self.client, 'fetch_open_interest'):
+                return await self.client.fetch_open_interest(symbol)
+        except Exception:
+            return None
+        return None
+
+    async def _dispatch(self, symbol: str, req: Dict[str, Any]):
+        kind = req.get("kind")
+        args = req.get("args") or {}
+        if kind == "ohlcv":
+            return await self.fetch_ohlcv(symbol, timeframe=args.get("timeframe", "1m"), limit=int(args.get("limit", 200)))
+        if kind == "orderbook":
+            return await self.fetch_order_book(symbol, limit=int(args.get("limit", 5)))
+        if kind == "trades":
+            return await self.fetch_trades(symbol, limit=int(args.get("limit", 200)))
+        if kind == "ticker":
+            return await self.fetch_ticker(symbol)
+        if kind == "funding_rate":
+            return await self.fetch_funding_rate(symbol)
+        if kind == "open_interest":
+            return await self.fetch_open_interest(symbol)
+        if kind == "positions":
+            return await self.fetch_positions([symbol])
+        if kind == "balance":
+            return await self.fetch_balance()
+        if kind == "open_orders":
+            return await self.fetch_open_orders(symbol)
+        raise ValueError(f"Unsupported request kind: {kind}")
+
+    async def fetch_snapshots(self, symbol: str, reqs: List[Dict[str, Any]]) -> List[Any]:
+        """Run requests ({"kind": ..., "args": {...}}, as in RequestItem) concurrently.
+
+        Results come back in request order; a failed request yields its exception
+        instead of cancelling the rest.
+        """
+        return await asyncio.gather(*[self._dispatch(symbol, r) for r in reqs], return_exceptions=True)
+
+
+class MarketStreams:
+    """Public market data kept current by ccxt.pro websocket subscriptions.
+
+    One task per feed (ticker, order book, trades, OHLCV per timeframe) runs on
+    the exchange's background loop and stores the latest message. Readers get
+    None whenever a feed is not live (not yet received, errored, or stale) and
+    are expected to fall back to REST.
+    """
+
+    def __init__(
+        self,
+        testnet: bool,
+        symbol: str,
+        timeframes: List[str],
+        ohlcv_limit: int = 200,
+        orderbook_limit: int = 5,
+        trades_window_ms: int = 60_000,
+        stale_after_sec: float = 10.0,
+    ):
+        # public feeds only: no keys needed
+        self.client = ccxt_pro.bybit(_client_options(None, None))
+        self.client.set_sandbox_mode(bool(testnet))
+        self.symbol = symbol
+        self.timeframes = timeframes
+        self.ohlcv_limit = ohlcv_limit
+        self.orderbook_limit = orderbook_limit
+        self.trades_window_ms = trades_window_ms
+        self.stale_after_sec = stale_after_sec
+        self._tasks: List[asyncio.Task] = []
+        # feed name -> monotonic time of the last message; dropped on error
+        self._live: Dict[str, float] = {}
+        self._ticker: Optional[dict] = None
+        self._order_book: Optional[dict] = None
+        self._ohlcv: Dict[str, List[list]] = {}
+        # (timestamp ms, side, amount) within trades_window_ms of the newest trade, with running sums
+        self._trades: Deque[Tuple[int, str, float]] = deque()
+        self._buy_vol = 0.0
+        self._sell_vol = 0.0
+        self._trades_lock = threading.Lock()
+
+    def start(self):
+        # must be called on the loop the tasks will run on
+        feeds: List[Tuple[str, Any]] = [
+            ("ticker", self._watch_ticker),
+            ("orderbook", self._watch_order_book),
+            ("trades", self._watch_trades),
+        ]
+        feeds += [(f"ohlcv:{tf}", lambda tf=tf: self._watch_ohlcv(tf)) for tf in self.timeframes]
+        self._tasks = [asyncio.create_task(self._run(name, step), name=f"ws-{name}") for name, step in feeds]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.client.close()
+
+    async def _run(self, name: str, step):
+        delay = 1.0
+        while True:
+            try:
+                await step()
+                self._live[name] = time.monotonic()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._live.pop(name, None)
+                if name.startswith("ohlcv:"):
+                    # candles may be missed while disconnected: reseed the history over REST on reconnect
+                    self._ohlcv.pop(name[len("ohlcv:"):], None)
+                logger.warning("Websocket feed %s failed: %s; retry in %.0fs", name, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _watch_ticker(self):
+        self._ticker = await self.client.watch_ticker(self.symbol)
+
+    async def _watch_order_book(self):
+        ob = await self.client.watch_order_book(self.symbol, _WS_ORDERBOOK_DEPTH)
+        # plain copy of the top levels: the ccxt.pro book keeps mutating on the loop thread
+        n = self.orderbook_limit
+        self._order_book = {
+            "bids": [list(b) for b in ob["bids"][:n]],
+            "asks": [list(a) for a in ob["asks"][:n]],
+            "timestamp": ob.get("timestamp"),
         }
-        self.client = ccxt.bybit(opts)
+
+    async def _watch_trades(self):
+        trades = await self.client.watch_trades(self.symbol)
+        with self._trades_lock:
+            for t in trades:
+                side = t.get("side")
+                amt = float(t.get("amount") or 0)
+                self._trades.append((int(t.get("timestamp") or 0), side, amt))
+                if side == "buy":
+                    self._buy_vol += amt
+                elif side == "sell":
+                    self._sell_vol += amt
+            if self._trades:
+                self._evict_trades(self._trades[-1][0] - self.trades_window_ms)
+
+    async def _seed_ohlcv(self, timeframe: str) -> List[list]:
+        bars = self._ohlcv[timeframe] = await self.client.fetch_ohlcv(self.symbol, timeframe=timeframe, limit=self.ohlcv_limit)
+        return bars
+
+    async def _watch_ohlcv(self, timeframe: str):
+        bars = self._ohlcv.get(timeframe)
+        if bars is None:
+            # the stream only carries new candles: seed the history over REST
+            bars = await self._seed_ohlcv(timeframe)
+        streamed = await self.client.watch_ohlcv(self.symbol, timeframe=timeframe)
+        if streamed and bars and streamed[0][0] - bars[-1][0] > timeframe_seconds(timeframe) * 1000:
+            # candles were skipped between the history and the stream: never serve a gapped series
+            bars = await self._seed_ohlcv(timeframe)
+        for bar in streamed:
+            # plain copies: ccxt.pro updates its cached rows in place on the loop thread
+            if bars and bar[0] == bars[-1][0]:
+                bars[-1] = list(bar)
+            elif not bars or bar[0] > bars[-1][0]:
+                bars.append(list(bar))
+        del bars[: -self.ohlcv_limit]
+
+    def _evict_trades(self, cutoff_ms: int):
+        while self._trades and self._trades[0][0] < cutoff_ms:
+            _ts, side, amt = self._trades.popleft()
+            if side == "buy":
+                self._buy_vol -= amt
+            elif side == "sell":
+                self._sell_vol -= amt
+        if not self._trades:
+            # resync the running sums whenever the window empties
+            self._buy_vol = self._sell_vol = 0.0
+
+    def _fresh(self, name: str, max_age: Optional[float] = None) -> bool:
+        at = self._live.get(name)
+        if at is None:
+            return False
+        return max_age is None or time.monotonic() - at <= max_age
+
+    def ticker(self) -> Optional[dict]:
+        return self._ticker if self._fresh("ticker", self.stale_after_sec) else None
+
+    def order_book(self) -> Optional[dict]:
+        return self._order_book if self._fresh("orderbook", self.stale_after_sec) else None
+
+    def ohlcv(self, timeframe: str) -> Optional[List[list]]:
+        # candles are pushed every few seconds at most, so only connection health is checked
+        bars = self._ohlcv.get(timeframe)
+        if not bars or not self._fresh(f"ohlcv:{timeframe}"):
+            return None
+        return list(bars)
+
+    def trades_flow(self, now_ms: int) -> Optional[Dict[str, float]]:
+        """Buy/sell volume and trade count over the last trades_window_ms, or None if not live."""
+        if not self._fresh("trades"):
+            return None
+        with self._trades_lock:
+            self._evict_trades(now_ms - self.trades_window_ms)
+            return {
+                "buy_volume": self._buy_vol,
+                "sell_volume": self._sell_vol,
+                "ticks_per_min": len(self._trades),
+                "cvd_delta": self._buy_vol - self._sell_vol,
+            }
+
+
+class _LoopThread:
+    # Long-lived event loop on a daemon thread: the async ccxt client (and its
+    # HTTP session) stays bound to one loop for the whole process.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="bybit-async", daemon=True)
+        self.thread.start()
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class BybitExchange:
+    def __init__(self, api_key: Optional[str], api_secret: Optional[str], testnet: bool):
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._testnet = testnet
+        self.client = ccxt.bybit(_client_options(api_key, api_secret))
         self.client.setSandboxMode(bool(testnet))
         self.markets = None
         self.market = None
+        self._market_info: Optional[MarketInfo] = None
+        self._loop: Optional[_LoopThread] = None
+        self._aclient: Optional[AsyncBybitExchange] = None
+        self.streams: Optional[MarketStreams] = None
 
     def init(self, symbol: str, margin_mode: str, leverage: int):
         self.markets = self.client.load_markets()
@@ -28,6 +325,8 @@ class BybitExchange:
         if not market.get("contract", False) or not market.get("linear", False):
             raise RuntimeError("Symbol is not a linear perpetual contract")
         self.market = market
+        # the market is fixed after init, so its MarketInfo is built once
+        self._market_info = build_market_info(market)
 
         # Try to set margin mode and leverage
         try:
@@ -42,8 +341,10 @@ class BybitExchange:
         except Exception:
             pass
 
-    def get_market_info(self):
-        return build_market_info(self.market)
+    def get_market_info(self) -> MarketInfo:
+        if self._market_info is None:
+            raise RuntimeError("init() not called")
+        return self._market_info
 
     # Snapshots
     def fetch_ohlcv(self, symbol: str, timeframe: str, limit: int = 200):
@@ -87,6 +388,55 @@ class BybitExchange:
             return None
         return None
 
+    def fetch_snapshots(self, symbol: str, reqs: List[Dict[str, Any]]) -> List[Any]:
+        """Blocking facade over AsyncBybitExchange.fetch_snapshots."""
+        return self._run_async(self._async_client().fetch_snapshots(symbol, reqs))
+
+    def start_streams(self, symbol: str, timeframes: List[str], **kwargs: Any) -> MarketStreams:
+        """Subscribe to public websocket feeds; snapshot builders read them via self.streams."""
+        if self.streams is None:
+            async def _create() -> MarketStreams:
+                streams = MarketStreams(self._testnet, symbol, timeframes, **kwargs)
+                streams.start()
+                return streams
+
+            self.streams = self._run_async(_create())
+        return self.streams
+
+    def _async_client(self) -> AsyncBybitExchange:
+        if self._aclient is None:
+            async def _create() -> AsyncBybitExchange:
+                # created inside the loop so ccxt binds its session to it
+                aclient = AsyncBybitExchange(self._api_key, self._api_secret, self._testnet)
+                await aclient.init()
+                return aclient
+
+            self._aclient = self._run_async(_create())
+        return self._aclient
+
+    def _run_async(self, coro: Coroutine[Any, Any, T]) -> T:
+        if self._loop is None:
+            self._loop = _LoopThread()
+        return self._loop.run(coro)
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self.streams is not None:
+            try:
+                self._loop.run(self.streams.close())
+            except Exception:
+                pass
+            self.streams = None
+        if self._aclient is not None:
+            try:
+                self._loop.run(self._aclient.close())
+            except Exception:
+                pass
+            self._aclient = None
+        self._loop.stop()
+        self._loop = None
+
     # Actions
     def create_limit_order(
         self,
@@ -124,8 +474,8 @@ class BybitExchange:
     def cancel_all_orders(self, symbol: str):
         return self.client.cancel_all_orders(symbol)
 
-    def normalize_price_amount(self, price: float, amount: float) -> tuple[float, float]:
-        mi = self.get_market_info()
+    def normalize_price_amount(self, price: float, amount: float, mi: Optional[MarketInfo] = None) -> tuple[float, float]:
+        mi = mi or self.get_market_info()
         p = normalize_price(price, mi)
         a = normalize_amount(amount, mi)
         return p, a
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Optional
 import math
 
 
-@dataclass
+# frozen + slots: no per-instance __dict__, and hashable so normalize_* can be memoized
+@dataclass(frozen=True, slots=True)
 class MarketInfo:
     price_step: Optional[float]
     amount_step: Optional[float]
@@ -13,6 +15,26 @@ class MarketInfo:
     max_price: Optional[float]
     min_amount: Optional[float]
     max_amount: Optional[float]
+    # derived once from the steps so normalization is plain tick arithmetic
+    price_inv_step: Optional[float] = field(init=False, default=None)
+    price_decimals: int = field(init=False, default=0)
+    amount_inv_step: Optional[float] = field(init=False, default=None)
+    amount_decimals: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        price_inv_step, price_decimals = _step_params(self.price_step)
+        amount_inv_step, amount_decimals = _step_params(self.amount_step)
+        object.__setattr__(self, "price_inv_step", price_inv_step)
+        object.__setattr__(self, "price_decimals", price_decimals)
+        object.__setattr__(self, "amount_inv_step", amount_inv_step)
+        object.__setattr__(self, "amount_decimals", amount_decimals)
+
+
+def _step_params(step: Optional[float]) -> tuple[Optional[float], int]:
+    if step is None or step <= 0:
+        return None, 0
+    decimals = 0 if step >= 1 else max(0, int(round(-math.log10(step))))
+    return 1.0 / step, decimals
 
 
 def build_market_info(market: dict) -> MarketInfo:
@@ -49,18 +71,19 @@ def build_market_info(market: dict) -> MarketInfo:
     )
 
 
-def round_to_step_down(value: float, step: Optional[float]) -> float:
+def round_to_step_down(
+    value: float,
+    step: Optional[float],
+    inv_step: Optional[float] = None,
+    decimals: Optional[int] = None,
+) -> float:
     if step is None or step <= 0:
         return value
-    n = math.floor(value / step) * step
-    # format to a sensible number of decimals based on step
-    try:
-        if step >= 1:
-            return float(int(n))
-        decimals = max(0, int(round(-math.log10(step))))
-        return float(f"{n:.{decimals}f}")
-    except Exception:
-        return n
+    if inv_step is None or decimals is None:
+        inv_step, decimals = _step_params(step)
+    # whole ticks below value; rounding first absorbs float noise like 0.3 * 10 = 2.9999...
+    ticks = math.floor(round(value * inv_step, 9))  # type: ignore[operator]
+    return round(ticks * step, decimals)
 
 
 def clamp(value: float, vmin: Optional[float], vmax: Optional[float]) -> float:
@@ -71,13 +94,15 @@ def clamp(value: float, vmin: Optional[float], vmax: Optional[float]) -> float:
     return value
 
 
+@lru_cache(maxsize=4096)
 def normalize_price(price: float, market: MarketInfo) -> float:
-    p = round_to_step_down(price, market.price_step)
+    p = round_to_step_down(price, market.price_step, market.price_inv_step, market.price_decimals)
     p = clamp(p, market.min_price, market.max_price)
     return p
 
 
+@lru_cache(maxsize=4096)
 def normalize_amount(amount: float, market: MarketInfo) -> float:
-    a = round_to_step_down(amount, market.amount_step)
+    a = round_to_step_down(amount, market.amount_step, market.amount_inv_step, market.amount_decimals)
     a = clamp(a, market.min_amount, market.max_amount)
     return a
@@ -1,34 +1,100 @@
 from __future__ import annotations
 
-import json
+import logging
 import os
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional, Any, Dict, List
 
+import numpy as np
+import orjson
 import typer
-from dotenv import load_dotenv
 from rich.console import Console
 from rich.json import JSON
+from rich.logging import RichHandler
 import shortuuid
 
-from .config import load_config, AppConfig
+from .config import load_config, load_env, AppConfig
 from .exchange import BybitExchange
-from .scheduler import wait_for_next_closed_candle, last_closed_candle_open_time
+from .scheduler import TIMEFRAME_SECONDS, wait_for_next_closed_candle, last_closed_candle_open_time, timeframe_seconds
 from .chat import ChatClient
 from .decisions import Decision
 from .state import State
 from .risk import RiskLimits, check_open_orders_limit, check_orders_per_hour, would_exceed_position_usdt
 from .metrics import start_metrics_server_if_enabled, cycles_total, orders_placed_total, errors_total
-from .features import compute_features
+from .features import get_engine, resample_ohlcv
+from .formatting import round_to_step_down
 
 
 app = typer.Typer(add_completion=False, no_args_is_help=True)
 console = Console()
 
 
+def _dumps(obj: Any) -> str:
+    # action details are stored as TEXT
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+# policy.allowed_actions by whether placing a new order is allowed
+_ALLOWED_ACTIONS = {
+    True: ("place_order", "cancel_order", "close_position", "do_nothing"),
+    False: ("cancel_order", "close_position", "do_nothing"),
+}
+
+# client order id suffix generator; one instance instead of one per order
+_SUID = shortuuid.ShortUUID()
+
+_DETAILS_DRY = _dumps({"dry": True})
+_DETAILS_NO_POSITION = _dumps({"note": "no position"})
+_DETAILS_NOOP = _dumps({"note": "noop"})
+_DETAILS_UNSUPPORTED = _dumps({"reason": "unsupported_action"})
+
+
+@dataclass
+class CycleCtx:
+    """Clock and metric tallies shared by one decision cycle.
+
+    The clock is read once per step instead of calling time.time() in every
+    helper; tick() re-reads it where real time has passed (after the model
+    reply). Counter increments are tallied here and published by
+    flush_counters() at the end of the cycle.
+    """
+
+    now: float = field(default_factory=time.time)
+    orders_placed: int = 0
+    errors: int = 0
+
+    def tick(self) -> None:
+        self.now = time.time()
+
+    def flush_counters(self) -> None:
+        if self.orders_placed:
+            orders_placed_total.inc(self.orders_placed)
+        if self.errors:
+            errors_total.inc(self.errors)
+        self.orders_placed = self.errors = 0
+
+    @property
+    def now_s(self) -> int:
+        return int(self.now)
+
+    @property
+    def now_ms(self) -> int:
+        return int(self.now * 1000)
+
+
+def _setup_logging(level: str) -> None:
+    # bot.* modules log through the stdlib: route them to the same rich console at logs.level
+    log = logging.getLogger("bot")
+    log.setLevel(level.upper())
+    if not log.handlers:
+        log.addHandler(RichHandler(console=console, show_path=False))
+
+
 def _load_cfg(path: str | None, overrides: Dict[str, Any]) -> AppConfig:
     cfg = load_config(path)
+    _setup_logging(cfg.logs.level)
     # CLI overrides (shallow for common fields)
     ex = cfg.exchange
     if overrides.get("symbol"):
@@ -43,62 +109,171 @@ def _load_cfg(path: str | None, overrides: Dict[str, Any]) -> AppConfig:
 
 
 def _init_clients(cfg: AppConfig, env_file: Optional[str] = None) -> tuple[BybitExchange, State, Optional[ChatClient]]:
-    if env_file:
-        load_dotenv(dotenv_path=env_file, override=False)
-    else:
-        load_dotenv(override=False)
+    load_env(env_file)
     bybit_key = os.getenv("BYBIT_API_KEY", "")
     bybit_secret = os.getenv("BYBIT_API_SECRET", "")
     openai_key = os.getenv("OPENAI_API_KEY", "")
 
     ex = BybitExchange(bybit_key, bybit_secret, cfg.exchange.testnet)
     ex.init(cfg.exchange.symbol, cfg.exchange.margin_mode, cfg.exchange.leverage)
-    st = State(cfg.runtime.state_db_path)
-    chat = ChatClient(openai_key, cfg.chat.model, cfg.chat.temperature, cfg.chat.system_prompt_path)
+    if cfg.exchange.websocket:
+        tf = cfg.exchange.timeframe
+        timeframes = [tf]
+        if PARENT_TF.get(tf) and tf not in RESAMPLE_BASE_LIMIT:
+            timeframes.append(PARENT_TF[tf])
+        ex.start_streams(
+            cfg.exchange.symbol,
+            timeframes,
+            ohlcv_limit=RESAMPLE_BASE_LIMIT.get(tf, _OHLCV_BARS),
+            stale_after_sec=cfg.exchange.websocket_stale_sec,
+        )
+    st = State(
+        cfg.runtime.state_db_path,
+        in_memory=cfg.runtime.state_in_memory,
+        snapshot_interval_sec=cfg.runtime.state_snapshot_interval_sec,
+    )
+    chat = ChatClient(
+        openai_key,
+        cfg.chat.model,
+        cfg.chat.temperature,
+        cfg.chat.system_prompt_path,
+        cache_size=cfg.chat.response_cache_size,
+        cache_ttl_sec=cfg.chat.response_cache_ttl_sec,
+        max_payload_bytes=cfg.chat.max_payload_bytes,
+    )
     return ex, st, chat
 
 
+def _positions_by_symbol(positions: List[dict]) -> Dict[str, dict]:
+    # reversed so the first position listed for a symbol wins (hedge mode may list two)
+    return {p.get("symbol"): p for p in reversed(positions)}
+
+
 def _get_position_for_symbol(positions: List[dict], symbol: str) -> Optional[dict]:
-    for p in positions:
-        if p.get("symbol") == symbol:
-            return p
-    return None
+    return _positions_by_symbol(positions).get(symbol)
 
 
 PARENT_TF = {"1m": "5m", "5m": "15m", "15m": "1h", "1h": "4h", "4h": "1d", "1d": "1w"}
 
+_OHLCV_BARS = 200
+# Bybit returns at most 1000 klines per request
+_MAX_OHLCV_LIMIT = 1000
+# Base-timeframe limit that covers _OHLCV_BARS higher-timeframe candles, for the timeframes
+# where that fits into one request; the higher timeframe is then resampled locally.
+RESAMPLE_BASE_LIMIT = {
+    tf: n
+    for tf, htf in PARENT_TF.items()
+    if (n := TIMEFRAME_SECONDS[htf] // TIMEFRAME_SECONDS[tf] * _OHLCV_BARS) <= _MAX_OHLCV_LIMIT
+}
+
+
+def _trades_flow(trades: List[dict], now_ms: int, window_ms: int = 60_000) -> dict:
+    # trades flow (last minute) from a REST trades list, as one pass over column arrays
+    trades = trades or []
+    n = len(trades)
+    ts = np.fromiter((t.get("timestamp") or 0 for t in trades), dtype=np.int64, count=n)
+    amt = np.fromiter((t.get("amount") or 0 for t in trades), dtype=np.float64, count=n)
+    sides = np.array([t.get("side") or "" for t in trades], dtype=object)
+    mask = (now_ms - ts) <= window_ms
+    buy_vol = float(amt[mask & (sides == "buy")].sum())
+    sell_vol = float(amt[mask & (sides == "sell")].sum())
+    return {
+        "buy_volume": buy_vol,
+        "sell_volume": sell_vol,
+        "ticks_per_min": int(mask.sum()),
+        "cvd_delta": buy_vol - sell_vol,
+    }
+
 
-def _build_snapshot(cfg: AppConfig, ex: BybitExchange, extra_data: dict | None) -> dict:
+def _build_snapshot(cfg: AppConfig, ex: BybitExchange, extra_data: dict | None, ctx: CycleCtx | None = None) -> dict:
     symbol = cfg.exchange.symbol
     timeframe = cfg.exchange.timeframe
-    ohlcv_full = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=200)
+    higher_tf = PARENT_TF.get(timeframe)
+    # higher-timeframe candles come from the base window when it can cover them
+    base_limit = RESAMPLE_BASE_LIMIT.get(timeframe)
+    resample = base_limit is not None
+
+    now_ms = (ctx or CycleCtx()).now_ms
+
+    # Public data comes from the websocket feeds while they are live; everything
+    # else (and any feed that is down) goes into one concurrent REST batch.
+    streams = ex.streams
+    ohlcv_full = streams.ohlcv(timeframe) if streams else None
+    ohlcv_h = streams.ohlcv(higher_tf) if streams and higher_tf and not resample else None
+    ticker = streams.ticker() if streams else None
+    ob = streams.order_book() if streams else None
+    trades_flow = streams.trades_flow(now_ms) if streams else None
+
+    reqs: Dict[str, dict] = {
+        "balance": {"kind": "balance"},
+        "positions": {"kind": "positions"},
+        "open_orders": {"kind": "open_orders"},
+        "funding_rate": {"kind": "funding_rate"},
+        "open_interest": {"kind": "open_interest"},
+    }
+    if ohlcv_full is None:
+        reqs["ohlcv"] = {"kind": "ohlcv", "args": {"timeframe": timeframe, "limit": base_limit or _OHLCV_BARS}}
+    if ticker is None:
+        reqs["ticker"] = {"kind": "ticker"}
+    if ob is None:
+        reqs["orderbook"] = {"kind": "orderbook", "args": {"limit": 5}}
+    if trades_flow is None:
+        reqs["trades"] = {"kind": "trades", "args": {"limit": 200}}
+    if higher_tf and not resample and ohlcv_h is None:
+        reqs["ohlcv_h"] = {"kind": "ohlcv", "args": {"timeframe": higher_tf, "limit": _OHLCV_BARS}}
+    results = dict(zip(reqs, ex.fetch_snapshots(symbol, list(reqs.values()))))
+    # required data: a failure aborts the snapshot, as with sequential calls
+    for key in ("ohlcv", "balance", "positions", "open_orders", "ticker"):
+        if isinstance(results.get(key), BaseException):
+            raise results[key]
+    balance = results["balance"]
+    positions = results["positions"]
+    open_orders = results["open_orders"]
+    if ohlcv_full is None:
+        ohlcv_full = results["ohlcv"]
+    if ticker is None:
+        ticker = results["ticker"]
+    if ob is None:
+        ob = results["orderbook"]
+    if ohlcv_h is None and higher_tf and not resample:
+        ohlcv_h = results["ohlcv_h"]
+    # optional data (trades, funding, open interest) degrades to empty, as the sync fetchers do
+    fr = results["funding_rate"]
+    oi = results["open_interest"]
+    if isinstance(fr, BaseException):
+        fr = None
+    if isinstance(oi, BaseException):
+        oi = None
+
     # shrink to reduce tokens while computing features from full
     ohlcv = ohlcv_full[-120:]
-    base_features = compute_features(ohlcv_full)
+    # columnar float64 copy made once per snapshot; features read it as column views
+    ohlcv_arr = np.asarray(ohlcv_full, dtype=np.float64)
+    base_features = get_engine(symbol, timeframe).update(ohlcv_arr[-_OHLCV_BARS:] if resample else ohlcv_arr)
+    if resample and higher_tf:
+        ohlcv_h = resample_ohlcv(ohlcv_arr, TIMEFRAME_SECONDS[higher_tf] * 1000)
 
-    higher_tf = PARENT_TF.get(timeframe)
     higher_features = None
-    if higher_tf:
+    if higher_tf and not isinstance(ohlcv_h, BaseException):
         try:
-            ohlcv_h = ex.fetch_ohlcv(symbol, timeframe=higher_tf, limit=200)
-            higher_features = {"timeframe": higher_tf, **compute_features(ohlcv_h)}
+            higher_features = {"timeframe": higher_tf, **get_engine(symbol, higher_tf).update(ohlcv_h)}
         except Exception:
             higher_features = None
-    balance = ex.fetch_balance()
-    positions = ex.fetch_positions([symbol])
     position = _get_position_for_symbol(positions, symbol) if positions else None
-    open_orders = ex.fetch_open_orders(symbol)
-    ticker = ex.fetch_ticker(symbol)
     # order book summary
     try:
-        ob = ex.fetch_order_book(symbol, limit=5)
+        if isinstance(ob, BaseException):
+            raise ob
         bids = ob.get("bids") or []
         asks = ob.get("asks") or []
-        best_bid = bids[0][0] if bids else None
-        best_ask = asks[0][0] if asks else None
+        # top 5 levels as (price, amount) float arrays; volumes are column sums
+        bids_arr = np.asarray(bids[:5], dtype=np.float64) if bids else None
+        asks_arr = np.asarray(asks[:5], dtype=np.float64) if asks else None
+        best_bid = float(bids_arr[0, 0]) if bids_arr is not None else None
+        best_ask = float(asks_arr[0, 0]) if asks_arr is not None else None
         spread = (best_ask - best_bid) if (best_bid and best_ask) else None
-        sum_bid_vol = sum(b[1] for b in bids[:5]) if bids else None
-        sum_ask_vol = sum(a[1] for a in asks[:5]) if asks else None
+        sum_bid_vol = float(bids_arr[:, 1].sum()) if bids_arr is not None else None
+        sum_ask_vol = float(asks_arr[:, 1].sum()) if asks_arr is not None else None
         ob_summary = {
             "best_bid": best_bid,
             "best_ask": best_ask,
@@ -109,28 +284,9 @@ def _build_snapshot(cfg: AppConfig, ex: BybitExchange, extra_data: dict | None)
     except Exception:
         ob_summary = None
     mi = ex.get_market_info()
-    # trades flow (last minute)
-    trades = ex.fetch_trades(symbol, limit=200)
-    now_ms = int(time.time() * 1000)
-    window_ms = 60_000
-    buy_vol = 0.0
-    sell_vol = 0.0
-    tick_count = 0
-    for t in trades or []:
-        ts = int(t.get("timestamp") or 0)
-        if now_ms - ts <= window_ms:
-            tick_count += 1
-            side = t.get("side")
-            amt = float(t.get("amount") or 0)
-            if side == "buy":
-                buy_vol += amt
-            elif side == "sell":
-                sell_vol += amt
-    cvd_delta = buy_vol - sell_vol
-
-    # funding and open interest (if available)
-    fr = ex.fetch_funding_rate(symbol)
-    oi = ex.fetch_open_interest(symbol)
+    if trades_flow is None:
+        trades = results["trades"]
+        trades_flow = _trades_flow([] if isinstance(trades, BaseException) else trades, now_ms)
 
     market_snapshot = {
         "ticker": ticker,
@@ -147,12 +303,7 @@ def _build_snapshot(cfg: AppConfig, ex: BybitExchange, extra_data: dict | None)
             "base": base_features,
             "higher": higher_features,
         },
-        "trades_flow_1m": {
-            "buy_volume": buy_vol,
-            "sell_volume": sell_vol,
-            "ticks_per_min": tick_count,
-            "cvd_delta": cvd_delta,
-        },
+        "trades_flow_1m": trades_flow,
         "funding": fr,
         "open_interest": oi,
     }
@@ -176,7 +327,24 @@ def _build_snapshot(cfg: AppConfig, ex: BybitExchange, extra_data: dict | None)
     }
 
 
-def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Decision, snapshot: dict):
+def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Decision, snapshot: dict, ctx: CycleCtx):
+    # Claim the key up front (one INSERT ... RETURNING); the outcome updates the claimed row.
+    # Actions that may reach the exchange commit the claim first, so no write transaction is held
+    # across network calls; a noop's claim goes out with its deferred outcome.
+    key = decision.idempotency_key
+    if not st.try_claim(key, durable=decision.action != "do_nothing", now_ms=ctx.now_ms):
+        console.log(f"Idempotent skip for key={key}")
+        return
+    try:
+        _run_claimed_action(cfg, ex, st, decision, snapshot, ctx)
+    except Exception as e:
+        # resolve the claim: a key left 'pending' would never run again
+        ctx.errors += 1
+        st.update_action(key, "error", str(e))
+        raise
+
+
+def _run_claimed_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Decision, snapshot: dict, ctx: CycleCtx):
     symbol = cfg.exchange.symbol
     dry = cfg.runtime.dry_run
     risk_limits = RiskLimits(
@@ -185,10 +353,7 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         max_orders_per_hour=cfg.limits.max_orders_per_hour,
         reduce_only_when_closing=cfg.risk.reduce_only_when_closing,
     )
-
-    if st.has_action(decision.idempotency_key):
-        console.log(f"Idempotent skip for key={decision.idempotency_key}")
-        return
+    orders_last_hour = st.orders_last_hour(ctx.now_ms)
 
     action = decision.action
     params = decision.params
@@ -199,6 +364,8 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         qty = float(params.qty)  # type: ignore[attr-defined]
         post_only = params.post_only if getattr(params, 'post_only', None) is not None else cfg.exchange.post_only  # type: ignore[attr-defined]
         tif = getattr(params, 'time_in_force', None)
+        # static per symbol for the session: one lookup for the whole order path
+        mi = ex.get_market_info()
 
         ticker = snapshot["market_snapshot"]["ticker"]
         last_price = float(ticker.get("last") or ticker.get("close") or 0) or price
@@ -206,12 +373,12 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
 
         open_orders = snapshot["account_snapshot"]["open_orders"]
         if not check_open_orders_limit(len(open_orders), risk_limits):
-            st.record_action(decision.idempotency_key, "rejected", "open_orders_limit")
+            st.update_action(decision.idempotency_key, "rejected", "open_orders_limit")
             console.log("Open orders limit reached; rejecting")
             return
 
-        if not check_orders_per_hour(st.orders_last_hour(), risk_limits):
-            st.record_action(decision.idempotency_key, "rejected", "orders_per_hour_limit")
+        if not check_orders_per_hour(orders_last_hour, risk_limits):
+            st.update_action(decision.idempotency_key, "rejected", "orders_per_hour_limit")
             console.log("Orders/hour limit reached; rejecting")
             return
 
@@ -222,7 +389,7 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         current_usdt_val = abs(current_avg_price * current_pos_size)
 
         if would_exceed_position_usdt(current_usdt_val, additional_usdt, risk_limits):
-            st.record_action(decision.idempotency_key, "rejected", "max_position_usdt")
+            st.update_action(decision.idempotency_key, "rejected", "max_position_usdt")
             console.log("Max position USDT exceeded; rejecting")
             return
 
@@ -233,12 +400,10 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         required_margin = (additional_usdt / max(1, cfg.exchange.leverage)) * 1.02
         if free_usdt < required_margin:
             # Try to auto-reduce qty down to budget if possible
-            mi = ex.get_market_info()
             amount_step = mi.amount_step or 0.001
             min_amount = mi.min_amount or amount_step
             max_affordable_qty = (free_usdt * cfg.exchange.leverage) / max(1e-9, last_price)
             # round down to step
-            from bot.formatting import round_to_step_down
             adj_qty = round_to_step_down(max_affordable_qty, amount_step)
             # Ensure >= min_amount
             if adj_qty >= (min_amount or 0) and adj_qty > 0:
@@ -247,7 +412,7 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
                 additional_usdt = abs(last_price * qty)
                 required_margin = (additional_usdt / max(1, cfg.exchange.leverage)) * 1.02
             else:
-                st.record_action(decision.idempotency_key, "rejected", f"insufficient_funds free={free_usdt} required~={required_margin}")
+                st.update_action(decision.idempotency_key, "rejected", f"insufficient_funds free={free_usdt} required~={required_margin}")
                 console.print(f"[yellow]Insufficient free USDT (~{free_usdt}) for margin (~{required_margin}). Skipping order.")
                 return
 
@@ -256,13 +421,12 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         stop_loss = float(params.stop_loss)      # type: ignore[attr-defined]
 
         # normalize
-        nprice, nqty = ex.normalize_price_amount(price, qty)
+        nprice, nqty = ex.normalize_price_amount(price, qty, mi)
         # side-aware adjustment to avoid crossing the book; enable post_only if would cross
         ob = snapshot["market_snapshot"]["order_book_summary"] or {}
         best_bid = ob.get("best_bid") if isinstance(ob, dict) else None
         best_ask = ob.get("best_ask") if isinstance(ob, dict) else None
-        mi2 = ex.get_market_info()
-        step = mi2.price_step or 0.0
+        step = mi.price_step or 0.0
         auto_post_only = False
         if side == "buy" and best_ask:
             limit_cross = nprice >= best_ask
@@ -278,15 +442,14 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
             post_only = True
         console.log(f"Normalized price={nprice} qty={nqty}")
 
-        client_oid = f"gptbot-{int(time.time())}-{shortuuid.ShortUUID().random(length=5)}"
+        client_oid = f"gptbot-{ctx.now_s}-{_SUID.random(length=5)}"
         if dry:
             console.log(f"[dry-run] Would place LIMIT {side} {nqty} @ {nprice} clientOrderId={client_oid}")
-            st.record_order_attempt()
-            st.record_action(decision.idempotency_key, "completed", json.dumps({"dry": True}))
+            st.update_action(decision.idempotency_key, "completed", _DETAILS_DRY, order_attempt=True)
             return
 
+        # the attempt and its outcome are written in one commit after the exchange call
         try:
-            st.record_order_attempt()
             order = ex.create_limit_order(
                 symbol,
                 side,
@@ -299,13 +462,13 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
                 take_profit=take_profit,
                 stop_loss=stop_loss,
             )
-            orders_placed_total.inc()
-            st.record_action(decision.idempotency_key, "completed", json.dumps(order))
+            ctx.orders_placed += 1
+            st.update_action(decision.idempotency_key, "completed", _dumps(order), order_attempt=True)
             console.log(f"Order placed id={order.get('id')}")
         except Exception as e:
-            errors_total.inc()
+            ctx.errors += 1
             # Не допускаем выставления ордеров без TP/SL — никаких фолбэков
-            st.record_action(decision.idempotency_key, "error", str(e))
+            st.update_action(decision.idempotency_key, "error", str(e), order_attempt=True)
             console.print(f"[red]Order placement failed (no fallback without TP/SL): {e}")
 
     elif action == "cancel_order":
@@ -313,17 +476,17 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         all_for_symbol = getattr(params, 'all_for_symbol', None)
         if dry:
             console.log(f"[dry-run] Would cancel order_id={order_id} all_for_symbol={all_for_symbol}")
-            st.record_action(decision.idempotency_key, "completed", json.dumps({"dry": True}))
+            st.update_action(decision.idempotency_key, "completed", _DETAILS_DRY)
             return
         try:
             if order_id:
                 ex.cancel_order(order_id, symbol)
             elif all_for_symbol:
                 ex.cancel_all_orders(symbol)
-            st.record_action(decision.idempotency_key, "completed", None)
+            st.update_action(decision.idempotency_key, "completed", None)
         except Exception as e:
-            errors_total.inc()
-            st.record_action(decision.idempotency_key, "error", str(e))
+            ctx.errors += 1
+            st.update_action(decision.idempotency_key, "error", str(e))
             console.print(f"[red]Cancel failed: {e}")
 
     elif action == "close_position":
@@ -336,7 +499,7 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         position = snapshot["account_snapshot"].get("position") or {}
         pos_size = float(position.get("contracts") or position.get("contractsSize") or position.get("size") or 0)
         if pos_size == 0:
-            st.record_action(decision.idempotency_key, "completed", json.dumps({"note": "no position"}))
+            st.update_action(decision.idempotency_key, "completed", _DETAILS_NO_POSITION)
             return
         pos_side = position.get("side", "long").lower()
         close_side = "sell" if pos_side == "long" else "buy"
@@ -348,11 +511,11 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
         if not price:
             price = float(ticker.get("last") or ticker.get("close") or 0)
         nprice, namount = ex.normalize_price_amount(price, amount)
-        client_oid = f"gptbot-close-{int(time.time())}-{shortuuid.ShortUUID().random(length=5)}"
+        client_oid = f"gptbot-close-{ctx.now_s}-{_SUID.random(length=5)}"
 
         if dry:
             console.log(f"[dry-run] Would close {size_pct}% via LIMIT {close_side} {namount} @ {nprice} reduceOnly={reduce_only}")
-            st.record_action(decision.idempotency_key, "completed", json.dumps({"dry": True}))
+            st.update_action(decision.idempotency_key, "completed", _DETAILS_DRY)
             return
 
         try:
@@ -366,24 +529,25 @@ def _execute_action(cfg: AppConfig, ex: BybitExchange, st: State, decision: Deci
                 reduce_only=reduce_only,
                 post_only=None,
             )
-            orders_placed_total.inc()
-            st.record_action(decision.idempotency_key, "completed", json.dumps(order))
+            ctx.orders_placed += 1
+            st.update_action(decision.idempotency_key, "completed", _dumps(order))
             console.log(f"Close order placed id={order.get('id')}")
         except Exception as e:
-            errors_total.inc()
-            st.record_action(decision.idempotency_key, "error", str(e))
+            ctx.errors += 1
+            st.update_action(decision.idempotency_key, "error", str(e))
             console.print(f"[red]Close failed: {e}")
 
     elif action == "do_nothing":
-        st.record_action(decision.idempotency_key, "completed", json.dumps({"note": "noop"}))
+        # a lost noop breadcrumb only means the key can be re-evaluated
+        st.update_action(decision.idempotency_key, "completed", _DETAILS_NOOP, durable=False)
     else:
-        st.record_action(decision.idempotency_key, "rejected", json.dumps({"reason": "unsupported_action"}))
+        st.update_action(decision.idempotency_key, "rejected", _DETAILS_UNSUPPORTED)
 
 
-def _collect_extra_data(ex: BybitExchange, symbol: str, requests: List[dict], cache: dict | None = None) -> tuple[dict, bool]:
+def _collect_extra_data(ex: BybitExchange, symbol: str, requests: List[dict], cache: dict | None = None, ctx: CycleCtx | None = None) -> tuple[dict, bool]:
     out: dict = {}
     fetched_any = False
-    now_ts = int(time.time())
+    now_ts = (ctx or CycleCtx()).now_s
     for req in requests:
         kind = req.get("kind")
         args = req.get("args", {})
@@ -425,11 +589,12 @@ def _one_cycle(cfg: AppConfig, ex: BybitExchange, st: State, chat: ChatClient, r
     flags = {"terminal_on_last_info_request": True}
     extra_data: dict = {}
     cache: dict = {"ts": 0, "ticker": None, "positions": None, "open_orders": None, "order_book": None}
+    ctx = CycleCtx()
 
     def build_payload(remaining: int) -> dict:
-        snap = _build_snapshot(cfg, ex, extra_data)
+        snap = _build_snapshot(cfg, ex, extra_data, ctx)
         # update cache freshness
-        cache["ts"] = int(time.time())
+        cache["ts"] = ctx.now_s
         cache["ticker"] = snap["market_snapshot"]["ticker"]
         cache["positions"] = snap["account_snapshot"]["position"]
         cache["open_orders"] = snap["account_snapshot"]["open_orders"]
@@ -437,7 +602,7 @@ def _one_cycle(cfg: AppConfig, ex: BybitExchange, st: State, chat: ChatClient, r
 
         # Policy/constraints to guide the model
         open_orders_count = len(snap["account_snapshot"]["open_orders"] or [])
-        orders_last_hour = st.orders_last_hour()
+        orders_last_hour = st.orders_last_hour(ctx.now_ms)
         last_price = float((snap["market_snapshot"]["ticker"] or {}).get("last") or 0)
         position = snap["account_snapshot"].get("position") or {}
         pos_size = float(position.get("contracts") or position.get("size") or 0)
@@ -446,7 +611,7 @@ def _one_cycle(cfg: AppConfig, ex: BybitExchange, st: State, chat: ChatClient, r
         allowed_place = (open_orders_count < cfg.limits.max_open_orders) and (orders_last_hour < cfg.limits.max_orders_per_hour) and (max_remaining_usdt > 0)
 
         policy = {
-            "allowed_actions": [a for a in ["place_order" if allowed_place else None, "cancel_order", "close_position", "do_nothing"] if a],
+            "allowed_actions": _ALLOWED_ACTIONS[allowed_place],
             "constraints": {
                 "open_orders": open_orders_count,
                 "max_open_orders": cfg.limits.max_open_orders,
@@ -472,26 +637,36 @@ def _one_cycle(cfg: AppConfig, ex: BybitExchange, st: State, chat: ChatClient, r
             payload["_notice"] = "Внимание: осталась последняя попытка. Верни ТЕРМИНАЛЬНОЕ действие, не запрашивай данные."
         return payload
 
-    remaining = remaining_limit
-    while True:
-        payload = build_payload(remaining)
-        console.log("Snapshot built for %s@%s, candles=200" % (cfg.exchange.symbol, cfg.exchange.timeframe))
-        decision = chat.decide(payload, remaining)
-        console.log(f"Decision: {decision.action} key={decision.idempotency_key}")
-        if decision.action == "request_data":
-            # should only happen when remaining > 1 due to validation
-            requests = decision.params.requests  # type: ignore[attr-defined]
-            data, fetched_any = _collect_extra_data(ex, cfg.exchange.symbol, [r.model_dump() for r in requests], cache)
-            extra_data.update(data)
-            if fetched_any:
-                remaining -= 1
-            if remaining <= 0:
-                # force terminal next
-                remaining = 1
-            continue
-        else:
-            _execute_action(cfg, ex, st, decision, _build_snapshot(cfg, ex, extra_data))
-            break
+    try:
+        remaining = remaining_limit
+        while True:
+            ctx.tick()
+            payload = build_payload(remaining)
+            console.log("Snapshot built for %s@%s, candles=200" % (cfg.exchange.symbol, cfg.exchange.timeframe))
+            decision = chat.decide(payload, remaining)
+            # the model reply takes seconds: cache freshness and order ids use the time of the decision
+            ctx.tick()
+            console.log(f"Decision: {decision.action} key={decision.idempotency_key}")
+            if decision.action == "request_data":
+                # should only happen when remaining > 1 due to validation
+                requests = decision.params.requests  # type: ignore[attr-defined]
+                data, fetched_any = _collect_extra_data(ex, cfg.exchange.symbol, [r.model_dump() for r in requests], cache, ctx)
+                extra_data.update(data)
+                if fetched_any:
+                    remaining -= 1
+                if remaining <= 0:
+                    # force terminal next
+                    remaining = 1
+                continue
+            else:
+                # the payload this decision was made on already carries the snapshot the executor reads
+                _execute_action(cfg, ex, st, decision, payload, ctx)
+                break
+    finally:
+        # metrics accumulated during the cycle are published in one go
+        ctx.flush_counters()
+        # deferred (non-durable) state writes are committed by the end of the cycle
+        st.flush()
 
 
 @app.command()
@@ -514,6 +689,8 @@ def check(
         console.print(f"USDT free={usdt.get('free')} total={usdt.get('total')}")
     except Exception as e:
         console.print(f"[yellow]Balance fetch failed: {e}")
+    finally:
+        ex.close()
 
 
 @app.command()
@@ -528,8 +705,12 @@ def once(
     cfg = _load_cfg(config, {"symbol": symbol, "timeframe": timeframe, "testnet": testnet, "dry_run": dry_run})
     start_metrics_server_if_enabled(cfg.metrics.enabled, cfg.metrics.port)
     ex, st, chat = _init_clients(cfg, env_file)
-    _one_cycle(cfg, ex, st, chat, cfg.limits.max_info_requests_per_cycle)
-    cycles_total.inc()
+    try:
+        _one_cycle(cfg, ex, st, chat, cfg.limits.max_info_requests_per_cycle)
+        cycles_total.inc()
+    finally:
+        st.close()
+        ex.close()
 
 
 @app.command()
@@ -545,15 +726,21 @@ def run(
     start_metrics_server_if_enabled(cfg.metrics.enabled, cfg.metrics.port)
     ex, st, chat = _init_clients(cfg, env_file)
     tf = cfg.exchange.timeframe
+    # resolved once: an unknown timeframe fails here, not on every wait
+    period = timeframe_seconds(tf)
     console.print(f"[cyan]Starting loop on closed candles: {cfg.exchange.symbol}@{tf}")
-    while True:
-        wait_for_next_closed_candle(tf)
-        try:
-            _one_cycle(cfg, ex, st, chat, cfg.limits.max_info_requests_per_cycle)
-            cycles_total.inc()
-        except Exception as e:
-            errors_total.inc()
-            console.print(f"[red]Cycle error: {e}")
+    try:
+        while True:
+            wait_for_next_closed_candle(period)
+            try:
+                _one_cycle(cfg, ex, st, chat, cfg.limits.max_info_requests_per_cycle)
+                cycles_total.inc()
+            except Exception as e:
+                errors_total.inc()
+                console.print(f"[red]Cycle error: {e}")
+    finally:
+        st.close()
+        ex.close()
 
 
 def main():
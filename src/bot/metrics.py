@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import threading
 from typing import Optional
 
 from prometheus_client import Counter, start_http_server
@@ -9,16 +8,15 @@ from prometheus_client import Counter, start_http_server
 cycles_total = Counter("bot_cycles_total", "Total trading cycles executed")
 orders_placed_total = Counter("bot_orders_placed_total", "Total orders placed")
 errors_total = Counter("bot_errors_total", "Total errors")
+llm_cache_hits_total = Counter("bot_llm_cache_hits_total", "LLM replies served from the response cache")
+llm_cache_misses_total = Counter("bot_llm_cache_misses_total", "LLM requests not found in the response cache")
 
 
 def start_metrics_server_if_enabled(enabled: bool, port: int):
     if not enabled:
         return
-
-    def _run():
-        start_http_server(port)
-
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    # start_http_server already serves from its own daemon thread; calling it directly
+    # also surfaces bind errors (port in use) at startup instead of losing them in a thread
+    start_http_server(port)
 
 
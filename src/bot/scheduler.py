@@ -18,34 +18,43 @@ TIMEFRAME_SECONDS = {
 }
 
 
-def floor_ts_to_timeframe(ts: int | float, timeframe: str) -> int:
+def timeframe_seconds(timeframe: str | int) -> int:
+    # Resolve (and validate) a timeframe once; the helpers below also accept the resolved period
+    if isinstance(timeframe, int):
+        return timeframe
     s = TIMEFRAME_SECONDS.get(timeframe)
     if not s:
         raise ValueError(f"Unsupported timeframe: {timeframe}")
-    return int(ts // s * s)
+    return s
 
 
-def next_candle_close_time(timeframe: str, now_ts: float | None = None) -> int:
+def floor_ts(ts: int | float, period: int) -> int:
+    ts = int(ts)
+    return ts - ts % period
+
+
+def floor_ts_to_timeframe(ts: int | float, timeframe: str | int) -> int:
+    return floor_ts(ts, timeframe_seconds(timeframe))
+
+
+def next_candle_close_time(timeframe: str | int, now_ts: float | None = None) -> int:
     now_ts = now_ts or time.time()
-    base = floor_ts_to_timeframe(now_ts, timeframe)
-    return base + TIMEFRAME_SECONDS[timeframe]
+    period = timeframe_seconds(timeframe)
+    return floor_ts(now_ts, period) + period
 
 
 def wait_until(ts: int):
-    while True:
-        now = time.time()
-        if now >= ts:
-            return
-        time.sleep(min(0.5, max(0.01, ts - now)))
+    # one sleep to the deadline; re-check only in case the wall clock was stepped meanwhile
+    while (remaining := ts - time.time()) > 0:
+        time.sleep(remaining)
 
 
-def wait_for_next_closed_candle(timeframe: str):
+def wait_for_next_closed_candle(timeframe: str | int):
     close_ts = next_candle_close_time(timeframe)
     wait_until(close_ts)
 
 
-def last_closed_candle_open_time(timeframe: str, now_ts: float | None = None) -> int:
+def last_closed_candle_open_time(timeframe: str | int, now_ts: float | None = None) -> int:
     now_ts = now_ts or time.time()
-    close_ts = next_candle_close_time(timeframe, now_ts)
-    return close_ts - TIMEFRAME_SECONDS[timeframe]
-
+    period = timeframe_seconds(timeframe)
+    return next_candle_close_time(period, now_ts) - period
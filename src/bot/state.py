@@ -1,83 +1,344 @@
+"""Idempotency keys and the rolling order count, persisted in SQLite.
+
+The cost here is commit latency (fsync), not Python or SQL execution: a durable commit
+is one to two orders of magnitude slower than the statements inside it. The knobs that
+matter, in order:
+
+- journal_mode=WAL + synchronous=NORMAL: no fsync per commit, only at checkpoints;
+- fewer transactions: batched order attempts, deferred (durable=False) writes, one
+  INSERT ... RETURNING per claim instead of a read plus a write;
+- the statement cache (cached_statements, _SQL_* constants).
+
+Python-side micro-optimizations here will not show up in a cycle's latency.
+"""
 from __future__ import annotations
 
+import logging
 import sqlite3
+import threading
 import time
-from dataclasses import dataclass
+from collections import Counter, OrderedDict, deque
+from contextlib import closing
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
+
+
+_ACTION_CACHE_SIZE = 4096
+# Timestamps are wall-clock epoch milliseconds in INTEGER columns (varint-encoded on disk)
+_HOUR_MS = 3_600_000
+# orders_bucket ring size: one slot per second of the rolling hour
+_ORDER_BUCKETS = 3600
+_SCHEMA_VERSION = 2
+_DEFERRED_MAX_OPS = 32
+_DEFERRED_MAX_SEC = 0.1
+
+# Hot-path statements; the schema DDL stays inline in _migrate
+_SQL_HAS_ACTION = "SELECT 1 FROM actions WHERE key=? LIMIT 1"
+_SQL_CLAIM_ACTION = (
+    "INSERT INTO actions(key, status, details, created_at) VALUES (?, ?, ?, ?) ON CONFLICT(key) DO NOTHING RETURNING 1"
+)
+_SQL_RECORD_ACTION = "INSERT INTO actions(key, status, details, created_at) VALUES (?, ?, ?, ?) ON CONFLICT(key) DO NOTHING"
+_SQL_UPDATE_ACTION = "UPDATE actions SET status=?, details=? WHERE key=?"
+# SET expressions see the old row: a slot left over from an earlier hour restarts at the new count
+_SQL_ADD_ORDERS = (
+    "INSERT INTO orders_bucket(slot, sec, cnt) VALUES (?, ?, ?) ON CONFLICT(slot) DO UPDATE SET "
+    "cnt = CASE WHEN sec = excluded.sec THEN cnt + excluded.cnt ELSE excluded.cnt END, sec = excluded.sec"
+)
+_SQL_RECENT_ORDERS = "SELECT sec, cnt FROM orders_bucket WHERE sec > ? ORDER BY sec"
 
+logger = logging.getLogger(__name__)
 
-@dataclass
-class ActionRecord:
-    key: str
-    status: str
-    details: Optional[str]
-    created_at: float
+
+def _now_ms() -> int:
+    # wall clock, not monotonic: timestamps are persisted and compared across restarts
+    return int(time.time() * 1000)
 
 
 class State:
-    def __init__(self, db_path: str | Path):
+    def __init__(
+        self,
+        db_path: str | Path,
+        order_flush_size: int = 32,
+        order_flush_interval_sec: float = 5.0,
+        in_memory: bool = False,
+        snapshot_interval_sec: float = 30.0,
+    ):
+        if in_memory and snapshot_interval_sec <= 0:
+            raise ValueError("snapshot_interval_sec must be > 0")
         self.db_path = str(db_path)
+        # in_memory: work on a :memory: database restored from db_path, which is then only written
+        # by a backup every snapshot_interval_sec and on close(); a crash loses up to one interval
+        self._in_memory = in_memory
+        self._snapshot_stop = threading.Event()
+        # Order attempts are buffered and written in batches: on reaching order_flush_size,
+        # when the oldest is order_flush_interval_sec old, with the next record_action, or on close()
+        self._pending_orders: list[int] = []
+        self._order_flush_size = order_flush_size
+        self._order_flush_interval_sec = order_flush_interval_sec
+        # key -> exists, for recently checked or written idempotency keys
+        self._action_cache: OrderedDict[str, bool] = OrderedDict()
+        # non-durable writes left uncommitted: count and monotonic time of the first one
+        self._deferred_ops = 0
+        self._deferred_since = 0.0
+        # timestamps of order attempts within the last hour (written or pending), oldest first
+        self._recent_orders: deque[int] = deque()
         # Ensure parent directory exists if a directory component is provided
         p = Path(self.db_path)
         parent = p.parent
         if str(parent) not in {"", "."}:
             parent.mkdir(parents=True, exist_ok=True)
-        self._conn = sqlite3.connect(self.db_path)
+        # One long-lived connection, usable from any thread under self._lock. isolation_level=None
+        # turns off the implicit BEGIN before DML: transactions are opened explicitly (_begin).
+        # A handful of fixed SQL strings: the statement cache keeps each one compiled.
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            ":memory:" if in_memory else self.db_path, check_same_thread=False, isolation_level=None, cached_statements=256
+        )
+        if in_memory and p.exists():
+            disk = sqlite3.connect(self.db_path)
+            try:
+                disk.backup(self._conn)
+            finally:
+                disk.close()
         self._conn.execute("PRAGMA journal_mode=WAL;")
-        self._conn.row_factory = sqlite3.Row
+        # WAL + NORMAL: no fsync per commit (only at checkpoints); the database stays consistent,
+        # a power loss may drop the last few commits
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("PRAGMA journal_size_limit=6144000;")
+        self._conn.execute("PRAGMA temp_store=MEMORY;")
+        self._conn.execute("PRAGMA cache_size=-8000;")
+        self._conn.execute("PRAGMA mmap_size=67108864;")
+        # checkpoint the WAL into the main file every ~1000 pages rather than on every commit burst
+        self._conn.execute("PRAGMA wal_autocheckpoint=1000;")
         self._migrate()
+        # the rolling count is kept in memory; the table is read once to restore it
+        rows = self._conn.execute(_SQL_RECENT_ORDERS, (_now_ms() // 1000 - _ORDER_BUCKETS,)).fetchall()
+        for sec, n in rows:
+            self._recent_orders.extend([sec * 1000] * n)
+        if in_memory:
+            threading.Thread(target=self._snapshot_loop, args=(snapshot_interval_sec,), name="state-snapshot", daemon=True).start()
 
     def _migrate(self):
-        cur = self._conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS actions (
-                key TEXT PRIMARY KEY,
-                status TEXT NOT NULL,
-                details TEXT,
-                created_at REAL NOT NULL
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS orders_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ts REAL NOT NULL
-            );
-            """
-        )
-        self._conn.commit()
+        with closing(self._conn.cursor()) as cur:
+            # schema changes run in one transaction, so an interrupted upgrade leaves the old schema intact
+            cur.execute("BEGIN IMMEDIATE")
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            tables = {name for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            legacy = version < 1 and "actions" in tables
+            if legacy:
+                # v0 stored REAL epoch seconds: move actions aside and copy it over as integer ms
+                cur.execute("ALTER TABLE actions RENAME TO actions_v0")
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS actions (
+                    key TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    details TEXT,
+                    created_at INTEGER NOT NULL
+                );
+                """
+            )
+            # Ring of per-second order counters: slot = sec % _ORDER_BUCKETS, a slot whose sec is
+            # more than an hour old is simply overwritten. At most _ORDER_BUCKETS rows, never pruned.
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS orders_bucket (
+                    slot INTEGER PRIMARY KEY,
+                    sec INTEGER NOT NULL,
+                    cnt INTEGER NOT NULL
+                );
+                """
+            )
+            if legacy:
+                cur.execute(
+                    "INSERT INTO actions(key, status, details, created_at) "
+                    "SELECT key, status, details, CAST(created_at * 1000 AS INTEGER) FROM actions_v0"
+                )
+                cur.execute("DROP TABLE actions_v0")
+            if "orders_log" in tables:
+                # v0 (REAL seconds) and v1 (integer ms) kept a row per attempt: fold the last hour into buckets
+                sec = "CAST(ts AS INTEGER)" if version < 1 else "ts / 1000"
+                cur.execute(
+                    f"INSERT INTO orders_bucket(slot, sec, cnt) SELECT s % {_ORDER_BUCKETS}, s, COUNT(*) "
+                    f"FROM (SELECT {sec} AS s FROM orders_log) WHERE s > ? GROUP BY s",
+                    (_now_ms() // 1000 - _ORDER_BUCKETS,),
+                )
+                cur.execute("DROP TABLE orders_log")
+            cur.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+            cur.execute("COMMIT")
+
+    def _remember_action(self, key: str, exists: bool):
+        self._action_cache[key] = exists
+        self._action_cache.move_to_end(key)
+        if len(self._action_cache) > _ACTION_CACHE_SIZE:
+            self._action_cache.popitem(last=False)
 
     def has_action(self, key: str) -> bool:
-        cur = self._conn.cursor()
-        cur.execute("SELECT 1 FROM actions WHERE key=?", (key,))
-        row = cur.fetchone()
-        return row is not None
-
-    def record_action(self, key: str, status: str, details: Optional[str] = None):
-        now = time.time()
-        self._conn.execute(
-            "INSERT OR REPLACE INTO actions(key, status, details, created_at) VALUES (?, ?, ?, ?)",
-            (key, status, details, now),
-        )
-        self._conn.commit()
+        with self._lock:
+            cached = self._action_cache.get(key)
+            if cached is not None:
+                self._action_cache.move_to_end(key)
+                return cached
+            # fetchall steps each statement to completion, so it is reset right away rather than
+            # when the cursor is collected
+            exists = bool(self._conn.execute(_SQL_HAS_ACTION, (key,)).fetchall())
+            self._remember_action(key, exists)
+            return exists
+
+    def try_claim(
+        self,
+        key: str,
+        status: str = "pending",
+        details: Optional[str] = None,
+        order_attempt: bool = False,
+        durable: bool = True,
+        now_ms: Optional[int] = None,
+    ) -> bool:
+        """Record the action unless the key already exists; True if this call inserted it.
+
+        One INSERT ... RETURNING replaces has_action + record_action. order_attempt also logs
+        an order attempt, committed together with the action. durable=False defers the commit
+        (see _commit): for breadcrumbs whose loss on a crash is harmless. now_ms lets a
+        caller share one clock reading across calls.
+        """
+        now = _now_ms() if now_ms is None else now_ms
+        with self._lock:
+            if self._action_cache.get(key):
+                self._action_cache.move_to_end(key)
+                return False
+            self._begin()
+            inserted = bool(self._conn.execute(_SQL_CLAIM_ACTION, (key, status, details, now)).fetchall())
+            if order_attempt:
+                self._add_order_attempt(now)
+            # buffered order attempts ride along in this commit
+            self._insert_pending_orders()
+            self._commit(durable)
+            self._remember_action(key, True)
+            return inserted
+
+    def record_action(
+        self,
+        key: str,
+        status: str,
+        details: Optional[str] = None,
+        order_attempt: bool = False,
+        durable: bool = True,
+    ):
+        # First write for a key wins (idempotency); use update_action to change a recorded status.
+        self.try_claim(key, status, details, order_attempt=order_attempt, durable=durable)
+
+    def record_actions(self, items: Iterable[tuple[str, str, Optional[str]]], now_ms: Optional[int] = None):
+        """record_action for many (key, status, details) at once: one executemany, one commit."""
+        now = _now_ms() if now_ms is None else now_ms
+        rows = [(key, status, details, now) for key, status, details in items]
+        if not rows:
+            return
+        with self._lock:
+            self._begin()
+            self._conn.executemany(_SQL_RECORD_ACTION, rows)
+            self._insert_pending_orders()
+            self._commit()
+            for key, *_ in rows:
+                self._remember_action(key, True)
+
+    def _begin(self):
+        # a deferred (non-durable) write may have left the transaction open: keep adding to it
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+
+    def _commit(self, durable: bool = True):
+        # Deferred writes are committed with the next durable one, after _DEFERRED_MAX_OPS of them,
+        # once the oldest is _DEFERRED_MAX_SEC old (checked on the next write), or by flush()/close().
+        if not durable:
+            now = time.monotonic()
+            if self._deferred_ops == 0:
+                self._deferred_since = now
+            self._deferred_ops += 1
+            if self._deferred_ops < _DEFERRED_MAX_OPS and now - self._deferred_since < _DEFERRED_MAX_SEC:
+                return
+        self._conn.execute("COMMIT")
+        self._deferred_ops = 0
+
+    def update_action(
+        self,
+        key: str,
+        status: str,
+        details: Optional[str] = None,
+        order_attempt: bool = False,
+        durable: bool = True,
+        now_ms: Optional[int] = None,
+    ) -> bool:
+        """Change the status/details of a recorded action; False if the key is unknown."""
+        with self._lock:
+            self._begin()
+            cur = self._conn.execute(_SQL_UPDATE_ACTION, (status, details, key))
+            if order_attempt:
+                self._add_order_attempt(_now_ms() if now_ms is None else now_ms)
+                self._insert_pending_orders()
+            self._commit(durable)
+            return cur.rowcount > 0
+
+    def _add_order_attempt(self, now: int):
+        self._pending_orders.append(now)
+        self._recent_orders.append(now)
+
+    def record_order_attempt(self, now_ms: Optional[int] = None):
+        now = _now_ms() if now_ms is None else now_ms
+        with self._lock:
+            self._add_order_attempt(now)
+            if len(self._pending_orders) >= self._order_flush_size or now - self._pending_orders[0] >= self._order_flush_interval_sec * 1000:
+                self.flush()
+
+    def flush(self):
+        """Write buffered order attempts and commit deferred writes in one transaction."""
+        with self._lock:
+            if self._pending_orders or self._deferred_ops:
+                self._begin()
+                self._insert_pending_orders()
+                self._commit()
+
+    def _insert_pending_orders(self):
+        if self._pending_orders:
+            per_sec = Counter(t // 1000 for t in self._pending_orders)
+            self._conn.executemany(_SQL_ADD_ORDERS, [(sec % _ORDER_BUCKETS, sec, n) for sec, n in per_sec.items()])
+            self._pending_orders.clear()
+
+    def orders_last_hour(self, now_ms: Optional[int] = None) -> int:
+        # in-memory only: assumes this State is the only writer of orders_bucket
+        since = (_now_ms() if now_ms is None else now_ms) - _HOUR_MS
+        with self._lock:
+            recent = self._recent_orders
+            while recent and recent[0] < since:
+                recent.popleft()
+            return len(recent)
 
-    def record_order_attempt(self):
-        now = time.time()
-        self._conn.execute("INSERT INTO orders_log(ts) VALUES (?)", (now,))
-        self._conn.commit()
+    def snapshot(self):
+        """Copy the in-memory database to db_path (no-op for an on-disk State)."""
+        if not self._in_memory:
+            return
+        with self._lock:
+            # commit deferred writes first: the backup copies committed pages only
+            self.flush()
+            disk = sqlite3.connect(self.db_path)
+            try:
+                self._conn.backup(disk)
+            finally:
+                disk.close()
 
-    def orders_last_hour(self) -> int:
-        since = time.time() - 3600
-        cur = self._conn.cursor()
-        cur.execute("SELECT COUNT(*) c FROM orders_log WHERE ts >= ?", (since,))
-        return int(cur.fetchone()[0])
+    def _snapshot_loop(self, interval: float):
+        while not self._snapshot_stop.wait(interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.warning("State snapshot to %s failed: %s", self.db_path, e)
 
     def close(self):
-        try:
-            self._conn.close()
-        except Exception:
-            pass
+        self._snapshot_stop.set()
+        with self._lock:
+            try:
+                self.flush()
+                self.snapshot()
+                self._conn.close()
+            except Exception:
+                pass
 
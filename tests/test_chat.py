@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+from bot.chat import ChatClient, _dumps, _prune_payload, _PRUNE_MIN_ROWS
+
+_NOOP = '{"action": "do_nothing", "idempotency_key": "k1", "params": {}}'
+
+
+class _FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeCompletions:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def create(self, stream=False, **kwargs):
+        self.calls.append(kwargs)
+        reply = self.replies.pop(0)
+        if stream:
+            return reply if isinstance(reply, _FakeStream) else _FakeStream([reply])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+def _chat(tmp_path, replies, **kwargs):
+    prompt = tmp_path / "prompt.txt"
+    prompt.write_text("You are a trading bot.", encoding="utf-8")
+    chat = ChatClient("sk-test", "gpt-4o-mini", 0.0, str(prompt), **kwargs)
+    completions = _FakeCompletions(replies)
+    chat.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return chat, completions
+
+
+def test_prune_payload_keeps_latest_rows_within_budget():
+    ohlcv = [[i * 60_000, 100.0, 101.0, 99.0, 100.5, 12.5] for i in range(500)]
+    payload = {"config": {"symbol": "BTC/USDT:USDT"}, "recent_ohlcv": ohlcv, "extra_data": {}}
+    pruned = _prune_payload(payload, max_bytes=4096)
+    assert len(_dumps(pruned)) <= 4096
+    assert pruned["recent_ohlcv"] == ohlcv[-len(pruned["recent_ohlcv"]):]
+    assert len(pruned["recent_ohlcv"]) >= _PRUNE_MIN_ROWS
+    # caller's payload is untouched
+    assert len(payload["recent_ohlcv"]) == 500
+    assert _prune_payload(payload, max_bytes=0) is payload
+
+
+def test_prune_report_reaches_the_console(capsys):
+    from bot.main import _setup_logging
+    _setup_logging("INFO")
+    ohlcv = [[i * 60_000, 100.0, 101.0, 99.0, 100.5, 12.5] for i in range(500)]
+    _prune_payload({"recent_ohlcv": ohlcv}, max_bytes=4096)
+    assert "Payload pruned" in capsys.readouterr().out
+
+
+def test_prompt_fingerprint_reaches_the_console(tmp_path, capsys):
+    from bot.chat import ChatClient
+    from bot.main import _setup_logging
+    _setup_logging("INFO")
+    prompt = tmp_path / "prompt.txt"
+    prompt.write_text("You are a trading bot.", encoding="utf-8")
+    chat = ChatClient("sk-test", "gpt-4o-mini", 0.0, str(prompt))
+    assert f"fingerprint={chat._prompt_sha}" in capsys.readouterr().out
+
+
+def test_invalid_reply_is_not_cached(tmp_path):
+    chat, completions = _chat(tmp_path, ["not json", _NOOP, _NOOP])
+    payload = {"market": {"last": 1.0}}
+    assert chat.decide(payload, 5).idempotency_key == "k1"
+    # the first (invalid) reply was not cached: the same payload is asked again, then served from cache
+    assert chat.decide(payload, 5).idempotency_key == "k1"
+    assert chat.decide(payload, 5).idempotency_key == "k1"
+    assert len(completions.calls) == 3
+
+
+def test_stream_stops_at_the_first_complete_object(tmp_path):
+    # a nested "}" does not end the read; the closing one does, and the rest is never pulled
+    pieces = ['{"action": "do_nothing", "params": {}', ', "idempotency_key": "k1"}', " trailing junk"]
+    stream = _FakeStream(pieces)
+    chat, _ = _chat(tmp_path, [stream])
+    assert chat._complete(True, model="m", messages=[]) == pieces[0] + pieces[1]
+    assert stream.read == 2
+    assert stream.closed
+
+
+def test_truncated_stream_is_closed_and_rejected(tmp_path):
+    stream = _FakeStream(['{"action": "do_nothing", "idem'])
+    chat, completions = _chat(tmp_path, [stream, _NOOP])
+    # the cut reply fails strict parsing; the hint retry gets the valid one
+    assert chat.decide({"x": 1}, 5).idempotency_key == "k1"
+    assert stream.closed
+    assert len(completions.calls) == 2
+
+
+def test_retry_splices_hint_and_keeps_system_prompt(tmp_path):
+    import orjson
+    from bot.chat import _HINT_PREFIX
+    chat, completions = _chat(tmp_path, ["not json", _NOOP])
+    payload = {"market": {"last": 1.0}, "policy": {"allowed_actions": ["do_nothing"]}}
+    chat.decide(payload, 5)
+    first, second = completions.calls
+    assert second["messages"][0] == first["messages"][0] == {"role": "system", "content": "You are a trading bot."}
+    retried = second["messages"][1]["content"]
+    assert retried.startswith(_HINT_PREFIX)
+    assert orjson.loads(retried) == {"_hint": orjson.loads(_HINT_PREFIX + "}")["_hint"], **payload}
+    assert orjson.loads(first["messages"][1]["content"]) == payload
+
+
+def test_retry_hint_on_empty_payload(tmp_path):
+    import orjson
+    chat, completions = _chat(tmp_path, ["not json", _NOOP])
+    chat.decide({}, 5)
+    assert list(orjson.loads(completions.calls[1]["messages"][1]["content"])) == ["_hint"]
@@ -0,0 +1,58 @@
+import pytest
+
+from bot.config import _cast_env_value, env_overlay
+
+
+def _legacy_cast(value):
+    # the try/except casting the regexes replaced
+    if value.lower() in {"true", "false"}:
+        return value.lower() == "true"
+    try:
+        return float(value) if "." in value else int(value)
+    except ValueError:
+        return value
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("true", True),
+        ("TRUE", True),
+        ("False", False),
+        ("yes", "yes"),
+        ("1", 1),
+        ("007", 7),
+        ("-3", -3),
+        ("+3", 3),
+        ("1_000", 1000),
+        (" 42 ", 42),
+        ("-0.5", -0.5),
+        (".5", 0.5),
+        ("5.", 5.0),
+        ("1.5e3", 1500.0),
+        ("1.5E-3", 0.0015),
+        ("1e5", "1e5"),
+        ("1.2.3", "1.2.3"),
+        ("1__0", "1__0"),
+        ("nan", "nan"),
+        ("inf", "inf"),
+        ("", ""),
+        ("ETH/USDT:USDT", "ETH/USDT:USDT"),
+    ],
+)
+def test_cast_env_value(raw, expected):
+    value = _cast_env_value(raw)
+    assert value == expected and type(value) is type(expected)
+    assert type(_legacy_cast(raw)) is type(value) and _legacy_cast(raw) == value
+
+
+def test_env_overlay_nests_and_casts(monkeypatch):
+    monkeypatch.setenv("BGB__EXCHANGE__LEVERAGE", "007")
+    monkeypatch.setenv("BGB__EXCHANGE__TESTNET", "TRUE")
+    monkeypatch.setenv("BGB__CHAT__TEMPERATURE", "-0.5")
+    monkeypatch.setenv("BGB__EXCHANGE__SYMBOL", "1e5")
+    env_overlay.cache_clear()
+    assert env_overlay() == {
+        "exchange": {"leverage": 7, "testnet": True, "symbol": "1e5"},
+        "chat": {"temperature": -0.5},
+    }
@@ -43,3 +43,13 @@ def test_idempotency_in_state(tmp_path):
     assert not st.has_action(key)
     st.record_action(key, "completed", None)
     assert st.has_action(key)
+
+
+def test_validate_decision_json_from_raw_reply():
+    from bot.decisions import validate_decision_json
+    raw = b'{"action": "cancel_order", "idempotency_key": "k1", "params": {"all_for_symbol": true}}'
+    d = validate_decision_json(raw, remaining_info_requests=3)
+    assert d.action == "cancel_order"
+    assert d.params.all_for_symbol is True
+    with pytest.raises(ValidationError):
+        validate_decision_json("not json", remaining_info_requests=3)
@@ -0,0 +1,98 @@
+import asyncio
+
+from bot.exchange import MarketStreams
+
+
+class _FakeProClient:
+    def __init__(self):
+        self.book_limits = []
+
+    async def watch_order_book(self, symbol, limit=None):
+        self.book_limits.append(limit)
+        # mirrors ccxt.pro bybit: swap books accept only these depths
+        if limit not in (1, 50, 200, 1000):
+            raise ValueError(f"invalid order book limit {limit}")
+        await asyncio.sleep(0)
+        return {
+            "bids": [[100.0 - i, 1.0] for i in range(50)],
+            "asks": [[101.0 + i, 1.0] for i in range(50)],
+            "timestamp": 1,
+        }
+
+
+class _FakeCandleClient:
+    """REST history up to `now` minutes; the stream replays `pushes` (a list per message, or an exception)."""
+
+    def __init__(self, now, pushes):
+        self.now = now
+        self.pushes = list(pushes)
+        self.fetches = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe=None, limit=None):
+        self.fetches += 1
+        return [_bar(m) for m in range(self.now - limit + 1, self.now + 1)]
+
+    async def watch_ohlcv(self, symbol, timeframe=None):
+        await asyncio.sleep(0)
+        push = self.pushes.pop(0) if self.pushes else []
+        if isinstance(push, Exception):
+            raise push
+        return push
+
+
+def _bar(minute):
+    return [minute * 60_000, 1.0, 1.0, 1.0, 1.0, 1.0]
+
+
+def _streams(client, **kwargs):
+    streams = MarketStreams(False, "ETH/USDT:USDT", [], **kwargs)
+    streams.client = client
+    return streams
+
+
+async def _run_feed(streams, name, step):
+    task = asyncio.create_task(streams._run(name, step))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_order_book_feed_goes_live_with_valid_depth():
+    client = _FakeProClient()
+    streams = _streams(client, orderbook_limit=5)
+    asyncio.run(_run_feed(streams, "orderbook", streams._watch_order_book))
+    assert set(client.book_limits) == {50}
+    book = streams.order_book()
+    assert book is not None
+    assert len(book["bids"]) == 5 and len(book["asks"]) == 5
+    assert book["bids"][0] == [100.0, 1.0]
+
+
+def test_ohlcv_reseeds_history_over_a_gap():
+    client = _FakeCandleClient(now=10, pushes=[[_bar(10), _bar(11)]])
+    streams = _streams(client, ohlcv_limit=5)
+    asyncio.run(streams._watch_ohlcv("1m"))
+    assert client.fetches == 1
+    # the stream jumps to minute 15: the minutes in between are refetched, not skipped
+    client.now, client.pushes = 15, [[_bar(15)]]
+    asyncio.run(streams._watch_ohlcv("1m"))
+    assert client.fetches == 2
+    assert [b[0] // 60_000 for b in streams._ohlcv["1m"]] == [11, 12, 13, 14, 15]
+
+
+def test_ohlcv_history_dropped_when_feed_fails():
+    client = _FakeCandleClient(now=10, pushes=[[_bar(10)], ConnectionError("closed")])
+    streams = _streams(client, ohlcv_limit=5)
+    asyncio.run(_run_feed(streams, "ohlcv:1m", lambda: streams._watch_ohlcv("1m")))
+    assert streams.ohlcv("1m") is None
+    assert "1m" not in streams._ohlcv
+
+
+def test_ohlcv_rows_are_copied_from_the_stream():
+    row = _bar(11)
+    client = _FakeCandleClient(now=10, pushes=[[row]])
+    streams = _streams(client, ohlcv_limit=5)
+    asyncio.run(streams._watch_ohlcv("1m"))
+    # ccxt.pro rewrites the forming candle in place
+    row[4] = 99.0
+    assert streams._ohlcv["1m"][-1][4] == 1.0
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+
+from bot.features import FeatureEngine, compute_features, resample_ohlcv, _ema_last, _sma_last, _std_last, _rsi_last
+
+
+def _bars(closes):
+    return [[i * 60_000, c, c + 1.0, c - 1.0, c, 1.0] for i, c in enumerate(closes)]
+
+
+def test_sma_and_stddev_need_full_window():
+    x = np.array([1.0, 2.0, 3.0, 4.0])
+    assert math.isnan(_sma_last(x[:1], 2)) and math.isnan(_std_last(x[:1], 2))
+    assert _sma_last(x, 2) == 3.5
+    assert _std_last(x, 2) == 0.5
+
+
+def test_ema_seeded_with_sma():
+    x = np.array([1.0, 2.0, 3.0, 4.0])
+    assert math.isnan(_ema_last(x[:2], 3))
+    assert _ema_last(x[:3], 3) == 2.0
+    assert _ema_last(x, 3) == 4.0 * 0.5 + 2.0 * 0.5
+
+
+def test_rsi_monotonic_up_is_100():
+    x = np.arange(1.0, 20.0)
+    assert _rsi_last(x, 14) == 100.0
+    assert _rsi_last(np.arange(1.0, 100.0), 14) == 100.0
+
+
+def test_compute_features_short_history():
+    f = compute_features(_bars([100.0 + i for i in range(30)]))
+    assert f["ema20"] is not None
+    assert f["ema50"] is None and f["ema200"] is None
+    assert f["bb20_mid"] == sum(100.0 + i for i in range(10, 30)) / 20
+    assert f["vwap"] == sum(100.0 + i for i in range(30)) / 30
+    assert compute_features([]) == {}
+
+
+def _walk(n, seed=7):
+    rng = np.random.default_rng(seed)
+    closes = 100.0 * np.cumprod(1 + rng.normal(0, 0.01, n))
+    return [[i * 60_000, float(c), float(c) * 1.002, float(c) * 0.997, float(c), float(v)]
+            for i, (c, v) in enumerate(zip(closes, rng.uniform(1, 5, n)))]
+
+
+def _assert_close(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        assert (a[k] is None) == (b[k] is None), k
+        if a[k] is not None:
+            assert math.isclose(a[k], b[k], rel_tol=1e-9), k
+
+
+def test_feature_engine_cold_start_matches_compute_features():
+    bars = _walk(200)
+    _assert_close(FeatureEngine().update(bars), compute_features(bars))
+
+
+def test_feature_engine_advances_only_new_bars():
+    bars = _walk(180)
+    engine = FeatureEngine()
+    for n in range(120, 181, 7):
+        engine.update(bars[:n])
+    _assert_close(engine.update(bars), FeatureEngine().update(bars))
+    # the forming candle is not folded into the state, so its revisions are honoured
+    revised = bars[:-1] + [bars[-1][:4] + [bars[-1][4] * 1.05, bars[-1][5]]]
+    _assert_close(engine.update(revised), compute_features(revised))
+
+
+def test_feature_state_copy_is_independent():
+    engine = FeatureEngine()
+    engine.update(_walk(60))
+    before = engine.state.snapshot()
+    live = engine.state.copy()
+    live.push(60 * 60_000, 200.0, 150.0, 180.0, 9.0, engine.vwap_window)
+    assert live.snapshot() != before
+    assert engine.state.snapshot() == before
+
+
+def test_resample_ohlcv_aligns_and_drops_partial_head():
+    # 1m bars starting 2 minutes into a 5m bucket
+    start = 5 * 60_000 * 100 + 2 * 60_000
+    bars = np.array([[start + i * 60_000, i, i + 10, i - 10, i + 0.5, 1.0] for i in range(13)], dtype=np.float64)
+    out = resample_ohlcv(bars, 5 * 60_000)
+    # 3-bar head bucket is dropped, two 5-bar buckets remain
+    assert out[:, 0].tolist() == [start + 3 * 60_000, start + 8 * 60_000]
+    assert out[0].tolist()[1:] == [3, 17, -7, 7.5, 5.0]
+    assert out[1].tolist()[1:] == [8, 22, -2, 12.5, 5.0]
@@ -13,3 +13,11 @@ def test_clamp_min_max():
     assert normalize_price(21.23, mi) == 20.0
     assert normalize_amount(0.05, mi) == 0.1
     assert normalize_amount(10.0, mi) == 5.0
+
+
+def test_normalize_uses_whole_ticks_without_float_drift():
+    mi = MarketInfo(price_step=0.1, amount_step=0.01, min_price=None, max_price=None, min_amount=None, max_amount=None)
+    assert (mi.price_inv_step, mi.price_decimals) == (10.0, 1)
+    assert normalize_price(0.3, mi) == 0.3
+    assert normalize_amount(1.15, mi) == 1.15
+    assert normalize_amount(1.159, mi) == 1.15
@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+
+from bot.config import AppConfig
+from bot.decisions import validate_decision
+from bot.formatting import build_market_info
+from bot.main import CycleCtx, _build_snapshot, _execute_action
+from bot.state import State
+
+
+def _place_order(key="k1"):
+    return validate_decision(
+        {
+            "action": "place_order",
+            "idempotency_key": key,
+            "params": {"side": "buy", "price": 100.0, "qty": 0.1, "take_profit": 101.0, "stop_loss": 99.0},
+        },
+        remaining_info_requests=5,
+    )
+
+
+def _order_snapshot():
+    return {
+        "market_snapshot": {"ticker": {"last": 100.0}, "order_book_summary": None},
+        "account_snapshot": {"open_orders": [], "position": None, "balance": {"USDT": {"free": 1000.0}}},
+    }
+
+
+class _OrderEx:
+    def __init__(self, db_path, market_info_error=None):
+        self.db_path = db_path
+        self.market_info_error = market_info_error
+        self.seen_status = None
+
+    def get_market_info(self):
+        if self.market_info_error:
+            raise self.market_info_error
+        return build_market_info({"precision": {"price": 0.1, "amount": 0.001}, "limits": {}})
+
+    def normalize_price_amount(self, price, amount, mi=None):
+        return price, amount
+
+    def create_limit_order(self, *args, **kwargs):
+        # another writer must get in while the order is in flight
+        other = sqlite3.connect(self.db_path, timeout=0)
+        other.execute("BEGIN IMMEDIATE")
+        self.seen_status = other.execute("SELECT status FROM actions WHERE key='k1'").fetchone()[0]
+        other.execute("ROLLBACK")
+        other.close()
+        return {"id": "o1"}
+
+
+def test_claim_committed_before_exchange_call(tmp_path):
+    db = tmp_path / "state.db"
+    st = State(db)
+    ex = _OrderEx(str(db))
+    _execute_action(AppConfig(), ex, st, _place_order(), _order_snapshot(), CycleCtx())
+    assert ex.seen_status == "pending"
+    assert st._conn.execute("SELECT status FROM actions WHERE key='k1'").fetchone()[0] == "completed"
+
+
+def test_failed_action_resolves_claim(tmp_path):
+    st = State(tmp_path / "state.db")
+    ex = _OrderEx(str(tmp_path / "state.db"), market_info_error=RuntimeError("markets not loaded"))
+    ctx = CycleCtx()
+    with pytest.raises(RuntimeError):
+        _execute_action(AppConfig(), ex, st, _place_order(), _order_snapshot(), ctx)
+    assert ctx.errors == 1
+    assert tuple(st._conn.execute("SELECT status, details FROM actions WHERE key='k1'").fetchone()) == ("error", "markets not loaded")
+
+
+class _LiveStreams:
+    """Ticker and order book live; candles and trades stale."""
+
+    def ticker(self):
+        return {"last": 2.5}
+
+    def order_book(self):
+        return {"bids": [[2.4, 1.0]], "asks": [[2.6, 3.0]]}
+
+    def ohlcv(self, timeframe):
+        return None
+
+    def trades_flow(self, now_ms):
+        return None
+
+
+class _SnapshotEx:
+    def __init__(self, streams):
+        self.streams = streams
+        self.kinds = []
+
+    def fetch_snapshots(self, symbol, reqs):
+        now_ms = CycleCtx().now_ms
+        by_kind = {
+            "balance": {"USDT": {"free": 7.0}},
+            "positions": [{"symbol": "SNAP/USDT:USDT", "contracts": 1.0}],
+            "open_orders": [{"id": "o9"}],
+            "funding_rate": {"fundingRate": 0.0001},
+            "open_interest": RuntimeError("not supported"),
+            "ohlcv": [[i * 60_000, 1.0, 2.0, 0.5, 1.0 + i % 5, 10.0] for i in range(600)],
+            "trades": [{"timestamp": now_ms, "side": "buy", "amount": 2.0}, {"timestamp": now_ms, "side": "sell", "amount": 0.5}],
+        }
+        self.kinds = [r["kind"] for r in reqs]
+        return [by_kind[k] for k in self.kinds]
+
+    def get_market_info(self):
+        return build_market_info({"precision": {"price": 0.1, "amount": 0.001}, "limits": {}})
+
+
+def test_snapshot_batches_only_stale_feeds_to_rest():
+    cfg = AppConfig.model_validate({"exchange": {"symbol": "SNAP/USDT:USDT", "timeframe": "1m"}})
+    ex = _SnapshotEx(_LiveStreams())
+    snap = _build_snapshot(cfg, ex, None, CycleCtx())
+    # live ticker/book are not refetched; 5m candles are resampled from 1m, never requested
+    assert sorted(ex.kinds) == sorted(["balance", "positions", "open_orders", "funding_rate", "open_interest", "ohlcv", "trades"])
+    market, account = snap["market_snapshot"], snap["account_snapshot"]
+    assert market["ticker"] == {"last": 2.5}
+    assert market["order_book_summary"]["best_bid"] == 2.4 and market["order_book_summary"]["sum_ask_vol_top5"] == 3.0
+    assert market["trades_flow_1m"]["buy_volume"] == 2.0 and market["trades_flow_1m"]["sell_volume"] == 0.5
+    assert market["funding"] == {"fundingRate": 0.0001}
+    assert market["open_interest"] is None
+    assert market["features"]["higher"]["timeframe"] == "5m"
+    assert account["balance"] == {"USDT": {"free": 7.0}}
+    assert account["position"] == {"symbol": "SNAP/USDT:USDT", "contracts": 1.0}
+    assert account["open_orders"] == [{"id": "o9"}]
+    assert len(snap["recent_ohlcv"]) == 120 and snap["recent_ohlcv"][-1][0] == 599 * 60_000
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+
+from bot.state import State
+
+
+def test_order_attempts_are_batched(tmp_path):
+    st = State(tmp_path / "state.db", order_flush_size=3, order_flush_interval_sec=3600)
+    st.record_order_attempt()
+    st.record_order_attempt()
+    assert st.orders_last_hour() == 2
+    assert st._conn.execute("SELECT COUNT(*) FROM orders_bucket").fetchone()[0] == 0
+    st.record_order_attempt()
+    assert st._conn.execute("SELECT SUM(cnt) FROM orders_bucket").fetchone()[0] == 3
+    assert st.orders_last_hour() == 3
+
+
+def test_orders_last_hour_survives_restart(tmp_path):
+    st = State(tmp_path / "state.db")
+    st.record_action("k1", "completed", None, order_attempt=True)
+    st.record_order_attempt()
+    st.close()
+    assert State(tmp_path / "state.db").orders_last_hour() == 2
+
+
+def test_record_action_keeps_first_write(tmp_path):
+    st = State(tmp_path / "state.db")
+    st.record_action("k1", "completed", "first")
+    st.record_action("k1", "error", "second")
+    assert tuple(st._conn.execute("SELECT status, details FROM actions WHERE key='k1'").fetchone()) == ("completed", "first")
+    assert st.update_action("k1", "error", "second")
+    assert tuple(st._conn.execute("SELECT status, details FROM actions WHERE key='k1'").fetchone()) == ("error", "second")
+    assert not st.update_action("missing", "error", None)
+
+
+def test_non_durable_action_committed_on_flush(tmp_path):
+    st = State(tmp_path / "state.db")
+    st.record_action("k1", "completed", None, durable=False)
+    assert st.has_action("k1")
+    other = sqlite3.connect(tmp_path / "state.db")
+    assert other.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 0
+    st.flush()
+    assert other.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 1
+
+
+def test_try_claim_reports_fresh_insert(tmp_path):
+    st = State(tmp_path / "state.db")
+    assert st.try_claim("k1")
+    assert not st.try_claim("k1")
+    # a fresh instance has a cold cache: the duplicate is caught by SQLite
+    st.close()
+    st = State(tmp_path / "state.db")
+    assert not st.try_claim("k1", "completed")
+    assert st.update_action("k1", "completed", None, order_attempt=True)
+    assert st.orders_last_hour() == 1
+
+
+def test_in_memory_state_snapshots_on_close(tmp_path):
+    st = State(tmp_path / "state.db", in_memory=True)
+    assert st.try_claim("k1", "completed", order_attempt=True)
+    st.close()
+    st = State(tmp_path / "state.db", in_memory=True)
+    assert st.has_action("k1")
+    assert st.orders_last_hour() == 1
+    st.close()
+
+
+def test_record_actions_bulk(tmp_path):
+    st = State(tmp_path / "state.db")
+    st.record_action("k1", "completed", "first")
+    st.record_actions([("k1", "error", None), ("k2", "completed", None), ("k3", "rejected", "x")])
+    assert st.has_action("k2") and st.has_action("k3")
+    assert tuple(st._conn.execute("SELECT status FROM actions WHERE key='k1'").fetchone()) == ("completed",)
+
+
+def test_in_memory_state_rejects_non_positive_snapshot_interval(tmp_path):
+    with pytest.raises(ValueError):
+        State(tmp_path / "state.db", in_memory=True, snapshot_interval_sec=0)
+
+
+def test_orders_log_folded_into_buckets_on_upgrade(tmp_path):
+    import time
+    db = tmp_path / "state.db"
+    legacy = sqlite3.connect(db)
+    legacy.executescript(
+        "CREATE TABLE actions (key TEXT PRIMARY KEY, status TEXT NOT NULL, details TEXT, created_at INTEGER NOT NULL);"
+        "CREATE TABLE orders_log (id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL);"
+        "PRAGMA user_version=1;"
+    )
+    now_ms = int(time.time() * 1000)
+    # two attempts within the hour, one long expired
+    legacy.executemany("INSERT INTO orders_log(ts) VALUES (?)", [(now_ms - 1_000,), (now_ms - 1_000,), (now_ms - 7_200_000,)])
+    legacy.commit()
+    legacy.close()
+    st = State(db)
+    assert st.orders_last_hour() == 2
+    tables = {name for (name,) in st._conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert "orders_log" not in tables
+    assert st._conn.execute("SELECT COUNT(*), SUM(cnt) FROM orders_bucket").fetchone() == (1, 2)